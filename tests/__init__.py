@@ -34,6 +34,11 @@ class TestMixin(object):
                            executed.
         :param list args: arguments to pass to event handlers.
         """
+        if event == "draw_text" and event not in self.listeners:
+            for char in args[0]:
+                for callback in self.listeners.get("draw", []):
+                    callback(char, **self.flags)
+
         for callback in self.listeners.get(event, []):
             callback(*args, **self.flags)
         else:
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import random
+import time
+
+from vt102 import Screen, CompactScreen, DiffScreen, Stream, ByteStream
+
+
+class Sink(object):
+    def __init__(self):
+        self.count = 0
+
+    def dispatch_batch(self, events):
+        self.count += len(events)
+
+
+def test_params_limits():
+    stream = Stream()
+    stream.feed("\x1b[" + "1;" * 10000)
+    assert len(stream.params) == stream.params_limit
+
+    stream.reset()
+    stream.feed("\x1b[" + "9" * 10000)
+    assert len(stream.current) <= 5
+
+    # Leading zeros don't count.
+    stream.reset()
+    data = "\x1b[" + "0" * 100 + "12;" + "0" * 100 + "m"
+    assert list(stream.events(data)) == [
+        ("select_graphic_rendition", (12, 0), {})
+    ]
+
+    events = list(stream.events("\x1b[" + "9" * 10000 + "m"))
+    assert events == [("select_graphic_rendition", (9999, ), {})]
+
+    for data in ["\x1b[" + "1;" * 10000 + "m", "\x1b[" + "1;" * 30 + "m"]:
+        for chunk_size in [1, len(data)]:
+            [(event, args, _)] = Stream().events(data, chunk_size)
+            assert len(args) <= Stream.params_limit
+
+
+#: Building blocks of the fuzzer input.
+TOKENS = [
+    b"\x1b[", b"\x1b]", b"\x1bP", b"\x1b", b"\x9b", b"\x07", b"\n",
+    b"\r", b"\t", b"\x08", b"\x18", b"\x1b\\", b";", b"?", b"0", b"1",
+    b"9", b"999", b"m", b"H", b"J", b"K", b"@", b"P", b"L", b"M", b"X",
+    b"r", b"g", b"h", b"l", b"A", b"B", b"C", b"D", b"#8", b"(0", b"7",
+    b"8", b"foo", "þ".encode("utf-8"), b"\xff", b"\x00", b"\x7f"
+]
+
+
+def fuzz(rng, count=1000):
+    """Yields ``count`` random chunks of hostile input."""
+    for _ in xrange(count):
+        yield b"".join(rng.choice(TOKENS)
+                       for _ in xrange(rng.randint(1, 50)))
+
+
+def test_fuzz():
+    rng = random.Random(42)
+    for native in [False, True]:
+        sink = Sink()
+        stream = ByteStream(native=native, unknown="ignore")
+        stream.attach(sink)
+        for data in fuzz(rng):
+            count = sink.count
+            stream.feed(data)
+
+            # Parser state never grows past the limits and there's at
+            # most one event per byte.
+            assert len(stream.params) <= stream.params_limit
+            assert len(stream.current) <= max(5, stream.osc_limit)
+            assert sink.count - count <= len(data)
+
+
+def test_fuzz_screens():
+    # Untrusted input never breaks the screen, however it's delivered.
+    rng = random.Random(42)
+    for screen_type, deliver in [(Screen, "attach"), (Screen, "bind"),
+                                 (CompactScreen, "attach"),
+                                 (DiffScreen, "bind")]:
+        for native in [False, True]:
+            screen = screen_type(20, 6)
+            stream = ByteStream(native=native)
+            getattr(stream, deliver)(screen)
+            for data in fuzz(rng, 300):
+                stream.feed(data)
+
+                assert len(screen) == screen.lines
+                assert all(len(line) == screen.columns for line in screen)
+                assert 0 <= screen.cursor.x <= screen.columns
+                assert 0 <= screen.cursor.y < screen.lines
+
+
+def test_throughput():
+    # The cost per byte of hostile input shouldn't depend on its size.
+    def cost(data):
+        stream = ByteStream(unknown="ignore")
+        stream.attach(Screen(80, 24))
+        started = time.time()
+        stream.feed(data)
+        return (time.time() - started) / len(data)
+
+    for chunk in [b"\x1b[" + b"1;" * 1000 + b"m", b"\x1b[" + b"9" * 1000,
+                  b"\x1b[9999@\x1b[9999P\x1b[9999L\x1b[9999M\x1b[9999X",
+                  b"\x1b]" + b"x" * 1000, b"\x1b[9999;9999H\x1b[9999b"]:
+        small, large = cost(chunk * 10), cost(chunk * 100)
+        assert large < small * 5
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import tempfile
+
+from vt102.__main__ import trace
+
+
+def test_trace():
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write("foo\x1b[1;31mbarþ\x1b[m\r\n".encode("utf-8") * 100)
+
+        # a) profile only.
+        out = io.BytesIO()
+        trace(path, out)
+        report = out.getvalue().decode("utf-8")
+        assert report.startswith(
+            "bytes: 2000, characters: 1900, events: 600\n"
+            "bytes per event: 3.33\n"
+            "average text run: 3.50 characters\n")
+
+        sgr = report[report.index("sgr codes:"):].splitlines()[1:]
+        assert [line.split()[:2] for line in sgr] == [
+            ["0", "100"], ["1", "100"], ["31", "100"]
+        ]
+
+        # b) events, followed by the profile; sequences are split
+        #    between chunks.
+        out = io.BytesIO()
+        trace(path, out, events=True, only=["select_graphic_rendition"],
+              chunk_size=7)
+        lines = out.getvalue().splitlines()
+        assert [json.loads(line) for line in lines[:200]] == [
+            ["select_graphic_rendition", [1, 31], {}],
+            ["select_graphic_rendition", [0], {}]
+        ] * 100
+        assert lines[200] == b""
+        assert lines[201].startswith(b"bytes: 2000")
+    finally:
+        os.remove(path)
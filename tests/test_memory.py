@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import gc
+import sys
+import types
+
+from vt102 import Screen, CompactScreen, Stream, ByteStream, mo
+
+
+#: Per-session budget for an idle 80x24 session, documented in
+#: ``docs/index.rst``.
+BUDGET = 26 * 1024
+
+
+def footprint(factory):
+    """Returns the number of bytes, taken by objects which belong to a
+    single object created by ``factory`` and aren't shared with other
+    objects created by it.
+    """
+    def reachable(root, shared):
+        seen, queue = {}, [root]
+        while queue:
+            obj = queue.pop()
+            if id(obj) in seen or id(obj) in shared or isinstance(
+                    obj, (type, types.ModuleType, types.FunctionType)):
+                continue
+
+            seen[id(obj)] = obj
+            queue.extend(gc.get_referents(obj))
+        return seen
+
+    shared = reachable(factory(), {})
+    return sum(map(sys.getsizeof, reachable(factory(), shared).values()))
+
+
+def session(screen_type=Screen, data=b"\x1b[H\x1b[2Jhello\r\n"):
+    stream, screen = ByteStream(), screen_type(80, 24)
+    stream.attach(screen)
+    stream.feed(data)
+    return stream
+
+
+def test_session_budget():
+    assert footprint(session) < BUDGET
+
+
+def test_drawn_session_budget():
+    # Drawn characters are interned and compact screens don't keep
+    # them at all, so a screen full of text fits the budget as well.
+    data = b"\x1b[1m" + (b"x" * 79 + b"\r\n") * 24
+    compact = footprint(lambda: session(CompactScreen, data))
+    assert compact < footprint(lambda: session(Screen, data)) < BUDGET
+
+
+def test_interning():
+    screen, other = Screen(80, 24), Screen(80, 24)
+    for s in [screen, other]:
+        s.select_graphic_rendition(1, 31)
+        s.draw("x")
+        s.draw("x")
+        s.erase_characters(2)
+
+    assert screen.cursor.attrs is other.cursor.attrs
+    assert screen[0][0] is screen[0][1] is other[0][0]
+    assert screen[0][2] is screen.cursor.attrs
+
+    # The cache is bounded; once cleared, equal characters are no
+    # longer shared.
+    screen.intern_limit = 1
+    screen.draw("y")
+    assert screen[0][2] == screen.intern("y")
+    assert screen.intern("x") is not other[0][0]
+
+
+def test_method_overrides():
+    # Slots don't get in the way of overriding methods per instance.
+    stream, screen = Stream(), Screen(80, 24)
+    stream.bind(screen)
+    list(stream.events("foo"))
+    stream.feed("foo")
+    assert screen.display[0].startswith("foo")
+
+
+def test_mutable_defaults():
+    screen, other = Screen(80, 24), Screen(80, 24)
+    screen.mode.add(mo.IRM)
+    screen.tabstops.add(1)
+    assert mo.IRM not in other.mode and 1 not in other.tabstops
+
+    screen.reset()
+    assert screen.mode == other.mode == Screen.default_mode
+    assert screen.tabstops == other.tabstops
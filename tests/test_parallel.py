@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import tempfile
+
+from vt102 import Screen, ByteStream
+from vt102.parallel import split, tokenize, parse
+
+
+def test_split():
+    data = b"foo\nbar\nbaz\n\nqux"
+    assert list(split(data, 1)) == [(0, 4), (4, 8), (8, 12), (12, 13),
+                                    (13, 16)]
+    assert list(split(data, 5)) == [(0, 8), (8, 13), (13, 16)]
+    assert list(split(data, 100)) == [(0, 16)]
+    assert list(split(b"", 1)) == []
+
+
+def test_tokenize():
+    events, state = tokenize(b"foo\x1b[1;3")
+    assert events == [("draw_text", ("foo", ), {})]
+
+    events, state = tokenize(b"1H", state)
+    assert events == [("cursor_position", (1, 31), {})]
+    assert state == ByteStream().getstate()
+
+
+def test_parse():
+    data = b"".join([
+        "Garðabær\r\n".encode("utf-8"),
+        b"\x1b[1;31mfoo\x1b[0m\r\n" * 20,
+        # Neither of the newlines below is a sync point.
+        b"\x1b]0;multiline\ntitle\x07\x1b[2\nJ\x1b[3;1Hbar\r\n",
+        "þ\xb0".encode("utf-8") * 10,
+    ])
+
+    fd, path = tempfile.mkstemp()
+    try:
+        os.write(fd, data)
+        os.close(fd)
+
+        expected = Screen(20, 6)
+        stream = ByteStream()
+        stream.attach(expected)
+        stream.feed(data)
+
+        for chunk_size in [1, 7, 64, len(data)]:
+            screen = Screen(20, 6)
+            state = parse(path, screen, processes=2, chunk_size=chunk_size)
+            assert state == stream.getstate()
+            assert screen.display == expected.display
+            assert screen.cursor.x == expected.cursor.x
+            assert screen.cursor.y == expected.cursor.y
+    finally:
+        os.remove(path)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import io
+import json
+
+import pytest
+
+from vt102 import Screen, Stream, ByteStream
+from vt102.recorder import MAGIC, Recorder, Tracer, encode, decode, replay
+
+
+def test_roundtrip():
+    events = [
+        ("draw_text", ("Garðabær", ), {}),
+        ("cursor_position", (24, 1), {}),
+        ("set_mode", (1, 25), {"private": True}),
+        ("debug", (300, ), {"state": "escape", "unhandled": "]"}),
+        ("select_graphic_rendition", (), {}),
+        ("some_custom_event", (None, ), {}),
+    ]
+
+    assert list(decode(MAGIC + bytes(encode(events)))) == events
+
+
+def test_compact():
+    # Opcode, arg count, header and a byte per character.
+    assert len(encode([("draw_text", ("foo", ), {})])) == 6
+    assert len(encode([("cursor_position", (24, 80), {})])) == 5
+    assert len(encode([("linefeed", (), {})])) == 1
+
+
+def test_invalid_log():
+    with pytest.raises(ValueError):
+        list(decode(b"garbage"))
+
+
+def test_replay():
+    data = ("\x1b[1;31mfoo\r\n\x1b[?5h\x1b[2;3Hbar\x1b[0m baz" * 10).encode()
+
+    log = io.BytesIO()
+    stream = ByteStream()
+    stream.attach(Recorder(log))
+    stream.attach(Screen(10, 5))
+    for chunk in [data[:7], data[7:]]:
+        stream.feed(chunk)
+
+    expected = stream.listeners[1][0]
+    screen = Screen(10, 5)
+    replay(log.getvalue(), screen, batch_size=3)
+
+    assert screen == expected
+    assert screen.mode == expected.mode
+
+
+def test_tracer():
+    data = "\x1b[?25lfoo\x1b[1;2H\x1b[3;4Hþ\r\n"
+
+    # a) JSON lines.
+    out = io.BytesIO()
+    stream = Stream()
+    stream.attach(Tracer(out))
+    stream.feed(data)
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == [
+        ["reset_mode", [25], {"private": True}],
+        ["draw_text", ["foo"], {}],
+        ["cursor_position", [1, 2], {}],
+        ["cursor_position", [3, 4], {}],
+        ["draw_text", ["þ"], {}],
+        ["carriage_return", [], {}],
+        ["linefeed", [], {}]
+    ]
+
+    # b) binary format.
+    out = io.BytesIO()
+    stream = Stream()
+    stream.attach(Tracer(out, format="binary", only=["cursor_position"]))
+    stream.feed(data)
+    assert list(decode(out.getvalue())) == [
+        ("cursor_position", (1, 2), {}),
+        ("cursor_position", (3, 4), {})
+    ]
+
+    with pytest.raises(ValueError):
+        Tracer(out, format="xml")
+
+
+def test_tracer_sample():
+    out = io.BytesIO()
+    stream = Stream()
+    stream.attach(Tracer(out, only=["cursor_up"], sample=3))
+
+    # Sampling doesn't depend on how the input is split into batches.
+    for count in range(1, 11):
+        stream.feed("\x1b[{0}A\r".format(count) * count)
+
+    traced = [json.loads(line)[1][0]
+              for line in out.getvalue().splitlines()]
+    expected = [count for count in range(1, 11) for _ in range(count)]
+    assert traced == expected[::3]
+
+
+def test_tracer_buffer():
+    out = io.BytesIO()
+    stream = Stream()
+    tracer = Tracer(out, format="binary", buffer_size=64)
+    stream.attach(tracer)
+
+    stream.feed("foo")
+    assert out.getvalue() == MAGIC
+
+    stream.feed("bar" * 20)
+    assert len(out.getvalue()) > len(MAGIC)
+    assert not tracer.buffer
+
+    stream.feed("baz")
+    tracer.flush()
+    assert [args[0] for _, args, _ in decode(out.getvalue())] == \
+        ["foo", "bar" * 20, "baz"]
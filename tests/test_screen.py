@@ -6,8 +6,8 @@ import copy
 
 import pytest
 
-from vt102 import Screen, Stream, mo
-from vt102.screens import Char
+from vt102 import Screen, CompactScreen, DiffScreen, Stream, mo
+from vt102.screens import Char, CompactLine
 
 
 # Test helpers.
@@ -204,6 +204,95 @@ def test_draw():
     assert screen.display == ["yxa", "   ", "   "]
 
 
+def test_draw_text():
+    # Drawing a run is the same as drawing it character by character.
+    cases = [
+        # a) wrapping and scrolling,
+        ("", "abcdefghijklmnopq"),
+        # b) starting at the right margin,
+        ("abcd", "efg"),
+        # c) no wrapping, text past the right margin,
+        ("\x1b[?7l", "abcdefg"),
+        ("\x1b[?7lab", "cd"),
+        ("\x1b[?7labcd", "efg"),
+        # d) insert mode,
+        ("xyz\r\x1b[4h", "abcdefg"),
+        # e) translated characters,
+        ("\x0e", "lqqk"),
+        # f) wrapping with LNM reset.
+        ("\x1b[20l", "abcdefg"),
+    ]
+
+    for screen_type in [Screen, CompactScreen, DiffScreen]:
+        for setup, text in cases:
+            screens = screen_type(4, 3), screen_type(4, 3)
+            for screen in screens:
+                stream = Stream()
+                stream.attach(screen)
+                stream.feed(setup)
+                screen.draw("!")
+
+            expected, screen = screens
+            map(expected.draw, text)
+            screen.draw_text(text)
+
+            assert screen.display == expected.display
+            assert list(map(list, screen)) == list(map(list, expected))
+            assert (screen.cursor.x, screen.cursor.y) == \
+                (expected.cursor.x, expected.cursor.y)
+
+
+def test_draw_text_dirty():
+    screen = DiffScreen(4, 4)
+    screen.dirty.clear()
+    screen.draw_text("abcdefghi")
+    assert screen.dirty == set([0, 1, 2])
+
+    # Scrolling marks every line.
+    screen.dirty.clear()
+    screen.draw_text("abcdefgh")
+    assert screen.dirty == set([0, 1, 2, 3])
+
+    # Lines written are marked, even if the cursor moves up.
+    for draw in [lambda screen, text: map(screen.draw, text),
+                 DiffScreen.draw_text]:
+        screen = DiffScreen(5, 6)
+        screen.set_margins(2, 4)
+        screen.cursor_position(6, 1)
+        screen.dirty.clear()
+        draw(screen, "abcdefg")
+        assert screen.display[5] == "abcde"
+        assert screen.display[screen.cursor.y] == "fg   "
+        assert screen.dirty == set([5, screen.cursor.y])
+
+
+def test_draw_text_overridden_draw():
+    class Upper(Screen):
+        def draw(self, char):
+            super(Upper, self).draw(char.upper())
+
+    screen = Upper(4, 2)
+    screen.draw_text("abcdef")
+    assert screen.display == ["ABCD", "EF  "]
+
+    # Unless draw_text is overridden as well.
+    class Both(Upper):
+        def draw_text(self, text):
+            super(Both, self).draw_text(text[::-1])
+
+    screen = Both(4, 2)
+    screen.draw_text("abc")
+    assert screen.display == ["cba ", "    "]
+
+
+def test_draw_wrap_lnm():
+    # Auto wrap always returns the carriage.
+    screen = Screen(3, 3)
+    screen.reset_mode(mo.LNM)
+    map(screen.draw, "abcde")
+    assert screen.display == ["abc", "de ", "   "]
+
+
 def test_carriage_return():
     screen = Screen(3, 3)
     screen.cursor.x = 2
@@ -754,6 +843,12 @@ def test_insert_characters():
     assert screen[0] == [screen.default_char,
                          Char("s", fg="red"), Char("a", fg="red")]
 
+    # e) the number of characters doesn't depend on the current line.
+    screen = update(Screen(5, 3), ["", "", "foo"])
+    screen.cursor_position(3, 1)
+    screen.insert_characters(4)
+    assert screen.display[2] == "    f"
+
 
 def test_delete_characters():
     screen = update(Screen(3, 3), ["sam", "is ", "foo"], colored=[0])
@@ -1167,3 +1262,60 @@ def test_set_margins():
     screen.set_margins()
     assert screen.margins != (None, None)
     assert screen.margins == (0, 4)
+
+
+def test_dispatch_batch():
+    screen = Screen(4, 2)
+    screen.dispatch_batch([
+        ("draw_text", ("foo", ), {}),
+        ("carriage_return", (), {}),
+        ("set_mode", (5, ), {"private": True}),
+        ("debug", (), {"state": "escape", "unhandled": "]"}),
+        ("draw", ("b", ), {})
+    ])
+
+    assert screen.display == ["boo ", "    "]
+    assert mo.DECSCNM in screen.mode
+
+
+def test_compact_line():
+    chars = [Char("f", fg="red"), Char("o", bold=True), Char("o")]
+    line = CompactLine(chars)
+    assert len(line) == 3
+    assert line == chars and list(line) == chars
+    assert line[-1] == chars[-1]
+    assert line[1:] == chars[1:] and isinstance(line[1:], CompactLine)
+    assert line.text() == "foo"
+
+    line[0] = Char("b")
+    line[1:] = [Char("a"), Char("r", reverse=True)]
+    assert line == [Char("b"), Char("a"), Char("r", reverse=True)]
+
+    del line[1:]
+    line.extend([Char("!")] * 2)
+    assert line.text() == "b!!"
+    assert (line + [Char("?")]).text() == "b!!?"
+    assert line != CompactLine(chars)
+
+    # Identical attributes are stored once.
+    assert line.attrs[1] == line.attrs[2] == CompactLine([Char("?")]).attrs[0]
+
+
+def test_compact_screen():
+    data = ("\x1b#8" + "\x1b[1;31mfoo\x1b[0m bar\r\n" * 9 +
+            "\x1b[3;7r\x1b[4;1H\x1b[2Lbaz\x1b[6;3H\x1b[M\x1b[2;5H\x1b[4@"
+            "\x1b[2P\x1b[3X\x1b[1K\x1b[?5h\x1b[4h\x1b[44mqux\x1b[4l\r\x1bM"
+            "\x1bD\x1b[8;9H\x1b[J\x1b[?5l")
+
+    screens = Screen(10, 8), CompactScreen(10, 8)
+    for screen in screens:
+        stream = Stream()
+        stream.attach(screen)
+        stream.feed(data)
+        screen.resize(6, 12)
+
+    screen, compact = screens
+    assert all(isinstance(line, CompactLine) for line in compact)
+    assert compact.display == screen.display
+    assert [list(line) for line in compact] == screen
+
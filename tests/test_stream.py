@@ -2,9 +2,13 @@
 
 from __future__ import unicode_literals
 
+import os
+import pickle
+import tempfile
+
 import pytest
 
-from vt102 import ctrl, esc
+from vt102 import Screen, Stream, ByteStream, Coalescer, ctrl, esc, mo
 from . import TestStream, TestByteStream
 
 
@@ -190,3 +194,733 @@ def test_control_characters():
     assert handler.count == 1
     assert handler.args == (10, 10)
 
+
+def test_draw_text():
+    class Drawer(object):
+        def __init__(self):
+            self.seen = []
+
+        def draw(self, char):
+            self.seen.append(("draw", char))
+
+    class TextDrawer(Drawer):
+        def draw_text(self, text):
+            self.seen.append(("draw_text", text))
+
+    drawer, text_drawer = Drawer(), TextDrawer()
+    stream = Stream()
+    stream.attach(drawer)
+    stream.attach(text_drawer)
+    stream.feed("foo" + ctrl.CR + ctrl.ESC + "[5Cbar")
+
+    # a) runs of printable characters are dispatched in one go ...
+    assert text_drawer.seen == [("draw_text", "foo"), ("draw_text", "bar")]
+
+    # b) ... unless a listener only knows how to ``draw()``.
+    assert drawer.seen == [("draw", char) for char in "foobar"]
+    assert stream.state == "stream"
+
+
+def test_extending_tables():
+    class CustomStream(TestStream):
+        csi = dict(TestStream.csi, Z="cursor_back_tab")
+
+    handler = argcheck()
+    stream = CustomStream()
+    stream.connect("cursor_back_tab", handler)
+    stream.feed(ctrl.CSI + "2Z")
+
+    assert handler.count == 1
+    assert handler.args == (2, )
+
+    # The base class is left untouched.
+    handler = argcheck()
+    stream = TestStream()
+    stream.connect("debug", handler)
+    stream.feed(ctrl.CSI + "2Z")
+
+    assert handler.count == 1
+
+
+def test_routes():
+    class Bell(object):
+        def __init__(self):
+            self.count = 0
+
+        def bell(self):
+            self.count += 1
+
+    first, second = Bell(), Bell()
+    stream = Stream()
+    stream.attach(first)
+    stream.feed(ctrl.BEL + "foo")
+
+    assert first.count == 1
+    assert stream.routes["bell"] == (first.bell, )
+    assert stream.routes["draw_text"] == ()  # Nobody draws.
+
+    # a) routes are rebuilt on attach ...
+    stream.attach(second)
+    stream.feed(ctrl.BEL)
+    assert first.count == 2
+    assert second.count == 1
+
+    # b) ... and on detach.
+    stream.detach(first)
+    stream.feed(ctrl.BEL)
+    assert first.count == 2
+    assert second.count == 2
+
+
+def test_events():
+    stream = Stream()
+    events = stream.events(ctrl.CSI + "2J" + "foo" + ctrl.ESC + "[?9h",
+                           chunk_size=3)
+
+    # a) events are yielded lazily, without any listeners attached ...
+    assert next(events) == ("erase_in_display", (2, ), {})
+    assert next(events) == ("draw_text", ("foo", ), {})
+    assert next(events) == ("set_mode", (9, ), {"private": True})
+    assert list(events) == []
+
+    # ... flags aren't shared with events, dispatched later, even for
+    # control characters inside a sequence.
+    events = list(Stream().events("\x1b[\n?1h\x1b[?\r5l"))
+    assert events == [("linefeed", (), {}),
+                      ("set_mode", (1, ), {"private": True}),
+                      ("carriage_return", (), {}),
+                      ("reset_mode", (5, ), {"private": True})]
+
+    screen = Screen(4, 2)
+    screen.dispatch_batch(events)
+    assert screen.cursor.y == 1
+
+    # b) ... and the parser state is shared with ``feed()``.
+    handler = argcheck()
+    stream = TestStream()
+    stream.connect("cursor_position", handler)
+    assert list(stream.events(ctrl.CSI + "10")) == []
+    assert stream.state == "arguments"
+
+    stream.feed(";10" + esc.HVP)
+    assert handler.count == 1
+    assert handler.args == (10, 10)
+
+    # c) breaking out early leaves the rest of the input unparsed.
+    stream = Stream()
+    for event, args, flags in stream.events("foo" + ctrl.LF + "bar",
+                                            chunk_size=4):
+        if event == "linefeed":
+            break
+
+    assert stream.state == "stream"
+    assert "dispatch" not in vars(stream)
+
+
+def test_byte_stream_events():
+    stream = ByteStream()
+    assert list(stream.events("тест".encode("utf-8"), chunk_size=1)) == \
+        [("draw_text", (char, ), {}) for char in "тест"]
+
+
+def test_dispatch_batch():
+    class Batcher(object):
+        def __init__(self):
+            self.batches = []
+
+        def dispatch_batch(self, events):
+            self.batches.append(events)
+
+    class Listener(object):
+        cursor_position = argcheck()
+
+    batcher, handler = Batcher(), Listener.cursor_position
+    stream = Stream()
+    stream.attach(batcher)
+    stream.attach(Listener())  # Not a batch listener.
+
+    # a) all events from a single chunk are delivered in one call ...
+    stream.feed("foo" + ctrl.CSI + "?5;10H" + ctrl.BEL)
+    assert batcher.batches == [[
+        ("draw_text", ("foo", ), {}),
+        ("cursor_position", (5, 10), {"private": True}),
+        ("bell", (), {})
+    ]]
+
+    # ... while other listeners are still called for each event.
+    assert handler.count == 1
+
+    # b) nothing is delivered if nothing was dispatched.
+    stream.feed(ctrl.CSI + "5")
+    assert len(batcher.batches) == 1
+
+    # c) ``consume()`` delivers events right away.
+    stream.consume(esc.HVP)
+    assert batcher.batches[-1] == [("cursor_position", (5, ), {})]
+
+    # d) and detached listeners don't get anything.
+    stream.detach(batcher)
+    stream.feed(ctrl.BEL)
+    assert len(batcher.batches) == 2
+
+
+def test_csi_sequences_split():
+    data = ("\x1b[1;31mls\x1b[0m\x1b[?25l\x1b[10;20H\u009b5A\x1b[;5H"
+            "\x1b[2\nJ\x1b[12Z\x1b[3;?4m\x1b[1;2;3;4;5;6;7m\x1b[H")
+
+    expected = list(Stream().events(data))
+    assert expected[:6] == [
+        ("select_graphic_rendition", (1, 31), {}),
+        ("draw_text", ("ls", ), {}),
+        ("select_graphic_rendition", (0, ), {}),
+        ("reset_mode", (25, ), {"private": True}),
+        ("cursor_position", (10, 20), {}),
+        ("cursor_up", (5, ), {})
+    ]
+
+    # Sequences split at any point are parsed the same way, by the
+    # state machine.
+    expected = [event for event in expected if event[0] != "draw_text"]
+    for chunk_size in [1, 2, 3, 5, 7]:
+        events = list(Stream().events(data, chunk_size))
+        assert [event for event in events
+                if event[0] != "draw_text"] == expected
+
+
+def test_coalescer():
+    coalescer = Coalescer(Screen(10, 4))
+
+    # a) horizontal moves in the same direction are summed up, vertical
+    #    ones are left as is.
+    assert coalescer.coalesce([
+        ("cursor_forward", (), {}),
+        ("cursor_forward", (3, ), {}),
+        ("cursor_back", (2, ), {}),
+        ("cursor_down", (2, ), {}),
+        ("cursor_down", (), {})
+    ]) == [
+        ("cursor_forward", (4, ), {}),
+        ("cursor_back", (2, ), {}),
+        ("cursor_down", (2, ), {}),
+        ("cursor_down", (), {})
+    ]
+
+    # b) moves followed by an absolute position are dropped ...
+    assert coalescer.coalesce([
+        ("draw_text", ("foo", ), {}),
+        ("carriage_return", (), {}),
+        ("cursor_up", (), {}),
+        ("cursor_position", (2, 2), {})
+    ]) == [
+        ("draw_text", ("foo", ), {}),
+        ("cursor_position", (2, 2), {})
+    ]
+
+    # ... unless the position might be relative to the margins.
+    events = [
+        ("set_mode", (mo.DECOM >> 5, ), {"private": True}),
+        ("cursor_up", (), {}),
+        ("cursor_position", (2, 2), {})
+    ]
+    assert coalescer.coalesce(events) == events
+
+    # c) repeated or reset graphic rendition is overriden.
+    assert coalescer.coalesce([
+        ("select_graphic_rendition", (1, ), {}),
+        ("select_graphic_rendition", (1, ), {}),
+        ("select_graphic_rendition", (31, ), {}),
+        ("select_graphic_rendition", (0, 4), {}),
+        ("select_graphic_rendition", (), {})
+    ]) == [("select_graphic_rendition", (), {})]
+
+    assert coalescer.coalesce([
+        ("select_graphic_rendition", (1, ), {}),
+        ("select_graphic_rendition", (1, ), {}),
+        ("select_graphic_rendition", (31, ), {})
+    ]) == [
+        ("select_graphic_rendition", (1, ), {}),
+        ("select_graphic_rendition", (31, ), {})
+    ]
+
+
+def test_coalescer_screen():
+    data = ("\x1b[1m\x1b[1mfoo\x1b[C\x1b[C\x1b[0mbar\r\n\x1b[3A\x1b[4;5H"
+            "\x1b[31m\x1b[mbaz\x1b[2;8r\x1b[?6h\x1b[A\x1b[1;1Hqux\x1b[D\x1b[D!")
+
+    expected, screen = Screen(20, 6), Screen(20, 6)
+    stream = Stream()
+    stream.attach(expected)
+    stream.feed(data)
+
+    stream = Stream()
+    stream.attach(Coalescer(screen))
+    stream.feed(data)
+
+    assert screen.display == expected.display
+    assert (screen.cursor.x, screen.cursor.y) == \
+        (expected.cursor.x, expected.cursor.y)
+    assert screen.cursor.attrs == expected.cursor.attrs
+
+    events = list(Stream().events(data))
+    assert len(Coalescer(screen).coalesce(events)) < len(events)
+
+
+def test_coalescer_listener():
+    # A plain listener gets the same events as if attached directly.
+    class Listener(object):
+        def __init__(self):
+            self.seen = []
+
+        def draw(self, char):
+            self.seen.append(char)
+
+        def cursor_up(self, count=1):
+            self.seen.append(count)
+
+    expected, listener = Listener(), Listener()
+    for target in [expected, Coalescer(listener)]:
+        stream = Stream(unknown="ignore")
+        stream.attach(target)
+        stream.feed("hello\x1b[1;2A\x1b[2A\x1b[?2A")
+
+    assert listener.seen == expected.seen == list("hello") + [2]
+
+
+def test_control_strings():
+    handler, bugger, drawn = argstore(), counter(), argstore()
+    stream = TestStream()
+    stream.connect("osc", handler)
+    stream.connect("debug", bugger)
+    stream.connect("draw_text", drawn)
+
+    # a) OSC terminated either by BEL or ST, with an optional ``osc``
+    #    event ...
+    stream.feed(ctrl.ESC + "]0;~/src" + ctrl.BEL + "$ ")
+    stream.feed(ctrl.OSC + "8;;http://example.com" + ctrl.ESC + "\\")
+    stream.feed("link" + ctrl.ESC + "]8;;" + ctrl.ST)
+    assert handler.seen == ["0;~/src", "8;;http://example.com", "8;;"]
+
+    # b) ... split across chunks.
+    for char in ctrl.ESC + "]2;title" + ctrl.ESC + "\\":
+        stream.feed(char)
+    assert handler.seen[-1] == "2;title"
+
+    # c) DCS, APC and PM payload is skipped.
+    stream.feed(ctrl.ESC + "P1$r0m" + ctrl.ESC + "\\")
+    stream.feed(ctrl.ESC + "_Gi=1;AAAA" + ctrl.ESC + "\\")
+    stream.feed(ctrl.PM + "private" + ctrl.ST)
+
+    assert len(handler.seen) == 4
+    assert not bugger.count
+    assert drawn.seen == ["$ ", "link"]
+    assert stream.state == "stream"
+
+
+def test_control_strings_limit():
+    handler = argstore()
+    stream = TestStream()
+    stream.connect("osc", handler)
+    stream.feed(ctrl.OSC + "x" * (stream.osc_limit + 10))
+    stream.feed("y" * 10 + ctrl.BEL)
+
+    assert handler.seen == ["x" * stream.osc_limit]
+
+
+def test_unknown_policies():
+    sequence = ctrl.CSI + "6;Z" + ctrl.ESC + "=" + ctrl.CSI + "6;Z"
+
+    # a) "debug" -- the default one.
+    handler = argcheck()
+    stream = TestStream()
+    stream.connect("debug", handler)
+    stream.feed(sequence)
+    assert stream.unknown == "debug"
+    assert handler.count == 3
+
+    # b) "ignore" -- nothing is dispatched or counted.
+    handler = argcheck()
+    stream = TestStream(unknown="ignore")
+    stream.connect("debug", handler)
+    stream.feed(sequence + "foo")
+    assert not handler.count
+    assert not stream.unknown_sequences
+    assert stream.state == "stream"
+
+    # c) "count" -- nothing is dispatched, but each sequence is counted.
+    stream = TestStream(unknown="count")
+    stream.connect("debug", handler)
+    stream.feed(sequence)
+    assert not handler.count
+    assert stream.unknown_sequences == {
+        ("arguments", "Z"): 2,
+        ("escape", "="): 1
+    }
+
+    # d) "sample" -- every n-th sequence is dispatched.
+    stream = TestStream(unknown="sample")
+    stream.sample_rate = 2
+    stream.connect("debug", handler)
+    stream.feed(sequence * 2)
+    assert handler.count == 3  # Two for "Z" and one for "=".
+    assert handler.kwargs == {"state": "arguments", "unhandled": "Z"}
+
+    # e) "raise" -- the sequence is counted and an exception is raised.
+    stream = TestStream(unknown="raise")
+    with pytest.raises(KeyError):
+        stream.feed(sequence)
+    assert stream.unknown_sequences == {("arguments", "Z"): 1}
+    assert stream.getstate() == Stream().getstate()
+
+    # ... and the stream goes on with the rest of the input.
+    handler = argstore()
+    stream.connect("draw_text", handler)
+    stream.feed("bar")
+    assert handler.seen == ["bar"]
+
+    with pytest.raises(ValueError):
+        TestStream(unknown="explode")
+
+
+def test_byte_stream_unknown_policy():
+    stream = ByteStream(unknown="count")
+    stream.feed(b"\x1b=")
+    assert stream.unknown_sequences == {("escape", "="): 1}
+
+
+def test_byte_stream_fallbacks():
+    drawn = argstore()
+    stream = TestByteStream()
+    stream.connect("draw_text", drawn)
+
+    # a) only the offending byte is decoded with a fallback encoding.
+    stream.feed("Garðabær ".encode("utf-8") + b"\xb0 " +
+                "Garðabær".encode("utf-8"))
+    assert "".join(drawn.seen) == "Garðabær ░ Garðabær"
+    assert stream.fallbacks == {
+        ("utf-8", "strict"): 0,
+        ("cp437", "strict"): 1,
+        ("utf-8", "replace"): 0
+    }
+    assert stream.sticky == 0
+
+    # b) incomplete sequences are still buffered between chunks.
+    drawn.seen = []
+    stream.feed("ð".encode("utf-8")[:1])
+    stream.feed("ð".encode("utf-8")[1:] + b"\xb0")
+    assert "".join(drawn.seen) == "ð░"
+
+    # c) lots of fallbacks make the fallback decoder sticky ...
+    drawn.seen = []
+    stream.feed(b"\xb0" * (stream.fallback_limit + 2))
+    assert "".join(drawn.seen) == "░" * (stream.fallback_limit + 2)
+    assert stream.sticky == 1
+    assert stream.fallbacks[("cp437", "strict")] == \
+        2 + stream.fallback_limit + 1
+
+    # d) ... but only until the end of the chunk, so valid UTF-8 after
+    # a binary burst is decoded as such.
+    for native in [False, True]:
+        stream = TestByteStream(native=native)
+        stream.connect("draw_text", drawn)
+        stream.feed(bytes(bytearray(range(0x80, 0x100))))
+        assert stream.sticky == 1
+
+        drawn.seen = []
+        stream.feed("Garðabær ─│".encode("utf-8"))
+        assert "".join(drawn.seen) == "Garðabær ─│"
+        assert stream.sticky == 0
+
+
+def test_byte_stream_no_fallback():
+    stream = TestByteStream(encodings=[("ascii", "strict")])
+    with pytest.raises(UnicodeDecodeError):
+        stream.feed(b"\xff")
+
+
+def test_byte_stream_buffers():
+    data = "Garðabær".encode("utf-8")
+
+    for chunks in [[bytearray(data)],
+                   [memoryview(data)[:4], memoryview(data)[4:]],
+                   [buffer(data, 0, 4), buffer(data, 4)]]:
+        drawn = argstore()
+        stream = TestByteStream()
+        stream.connect("draw_text", drawn)
+        for chunk in chunks:
+            stream.feed(chunk)
+
+        assert "".join(drawn.seen) == "Garðabær"
+        assert isinstance(stream.buffer[0], bytes)
+
+
+def test_feed_from_fd():
+    drawn = argstore()
+    stream = TestByteStream()
+    stream.connect("draw_text", drawn)
+
+    r, w = os.pipe()
+    try:
+        os.write(w, "Garðabær".encode("utf-8"))
+        assert stream.feed_from_fd(r, bufsize=4) == 4
+        assert stream.feed_from_fd(r, bufsize=4) == 4
+        assert stream.feed_from_fd(r, bufsize=4) == 2
+
+        os.close(w)
+        assert stream.feed_from_fd(r) == 0
+    finally:
+        os.close(r)
+
+    assert "".join(drawn.seen) == "Garðabær"
+
+
+def test_feed_file():
+    drawn = argstore()
+    stream = TestByteStream()
+    stream.connect("draw_text", drawn)
+
+    with tempfile.NamedTemporaryFile() as f:
+        stream.feed_file(f.name)
+        assert not drawn.seen
+
+        f.write("Garðabær".encode("utf-8"))
+        f.flush()
+        stream.feed_file(f.name, chunk_size=3)
+
+    assert "".join(drawn.seen) == "Garðabær"
+
+
+def test_byte_stream_native():
+    def events(stream, data, chunk_size):
+        merged = []
+        for event in stream.events(data, chunk_size=chunk_size):
+            if merged and event[0] == merged[-1][0] == "draw_text":
+                event = ("draw_text", (merged.pop()[1][0] + event[1][0], ), {})
+            merged.append(event)
+        return merged
+
+    data = (
+        "Garðabær\r\n".encode("utf-8") + b"\x1b[1;31mfoo\x1b[0m \x1b[?25l" +
+        b"\x1b[10;\t20H\xb0\xb1" + "\x9b5Aþ".encode("utf-8") + b"\x1b7\x1b8" +
+        b"\x1b]0;title\x07\x1b[6;Z" + "ð".encode("utf-8")[:1] + b"\x1b[H" +
+        b"\x01\x1b[" + b"9" * 100 + b"m\x1b(0q\x1b#8\x00"
+    )
+
+    for chunk_size in [1, 2, 3, 7, len(data)]:
+        expected = events(ByteStream(), data, chunk_size)
+        assert events(ByteStream(native=True), data, chunk_size) == expected
+
+    assert ("cursor_position", (10, 20), {}) in expected
+    assert ("draw_text", ("░▒", ), {}) in expected
+
+
+def test_getstate():
+    # a) parsing can be resumed in the middle of a sequence ...
+    data = "\x1b[?5;10h\x1b]0;title\x07"
+    stream = Stream()
+    stream.feed(data[:6])
+    state = stream.getstate()
+    assert state == ("arguments", (5, ), "1", {"private": True})
+
+    resumed = Stream()
+    resumed.setstate(state)
+    assert list(resumed.events(data[6:])) == [
+        ("set_mode", (5, 10), {"private": True}),
+        ("osc", ("0;title", ), {})
+    ]
+
+    # ... and the source stream is left untouched.
+    assert stream.getstate() == state
+
+    # b) so can decoding of a multibyte character.
+    stream = ByteStream()
+    stream.feed("\x1b[1;31mþ".encode("utf-8")[:-1])
+    resumed = ByteStream()
+    resumed.setstate(stream.getstate())
+    assert list(resumed.events("þ".encode("utf-8")[-1:])) == [
+        ("draw_text", ("þ", ), {})
+    ]
+
+
+def test_pickle():
+    stream = ByteStream(encodings=[("cp437", "strict")], native=True,
+                        unknown="count")
+    stream.attach(Screen(10, 2))
+    stream.feed(b"\x1b[31")
+
+    copy = pickle.loads(pickle.dumps(stream, pickle.HIGHEST_PROTOCOL))
+    assert copy.getstate() == stream.getstate()
+    assert copy.encodings == [("cp437", "strict")]
+    assert copy.native and copy.unknown == "count"
+    assert not copy.listeners
+
+    assert list(copy.events(b"m\xb0")) == [
+        ("select_graphic_rendition", (31, ), {}),
+        ("draw_text", ("░", ), {})
+    ]
+
+
+def test_statistics():
+    # a) nothing is counted by default.
+    stream = Stream()
+    stream.feed("\x1b[1;31mfoo")
+    assert stream.statistics() == {"unknown": {}, "events": {}, "csi": {}}
+
+    # b) sequences are counted either way they're parsed.
+    stream = Stream(stats=True, unknown="ignore")
+    stream.attach(Screen(10, 2))
+    stream.feed("\x1b[1;31mfoo\x1b[")
+    stream.feed("1;2;3m\r\n\x1b[6;Z\x1b[H")
+    assert list(stream.events("\x1b[K")) == [("erase_in_line", (0, ), {})]
+
+    assert stream.statistics() == {
+        "characters": 31,
+        "bytes": 0,
+        "events": {"select_graphic_rendition": 2, "draw_text": 1,
+                   "carriage_return": 1, "linefeed": 1,
+                   "cursor_position": 1, "erase_in_line": 1},
+        "csi": {"m": 2, "Z": 1, "H": 1, "K": 1},
+        "params": 3,
+        "unknown": {("arguments", "Z"): 1}
+    }
+
+    # c) the result is a snapshot.
+    stats = stream.statistics()
+    stream.feed("\x1b[m")
+    assert stats["csi"]["m"] == 2
+
+
+def test_byte_stream_statistics():
+    data = "þ\x1b[2J".encode("utf-8") + b"\xb0"
+    for native in [False, True]:
+        stream = ByteStream(stats=True, native=native)
+        stream.feed(data[:1])
+        stream.feed(data[1:])
+
+        stats = stream.statistics()
+        assert stats["bytes"] == 7
+        assert stats["characters"] == 6
+        assert stats["csi"] == {"J": 1}
+        assert stats["fallbacks"] == {("utf-8", "strict"): 0,
+                                      ("cp437", "strict"): 1,
+                                      ("utf-8", "replace"): 0}
+
+
+def test_bind():
+    data = ("foo\x1b[1;31mbar\r\n\x1b[?6h\x1b[2;5Hbaz\x1b[10@\x1b]0;title\x07"
+            "\x1b(0qq\x0e\x1b[K")
+
+    expected, screen = Screen(20, 4), Screen(20, 4)
+    stream = Stream()
+    stream.attach(expected)
+    stream.feed(data)
+
+    stream = Stream()
+    stream.bind(screen)
+    for chunk in [data[:5], data[5:14], data[14:]]:
+        stream.feed(chunk)
+
+    assert screen.display == expected.display
+    assert screen.mode == expected.mode
+    assert screen.cursor.attrs == expected.cursor.attrs
+
+    # a) bound stream can't have other listeners ...
+    with pytest.raises(ValueError):
+        stream.attach(Screen(20, 4))
+
+    attached = Stream()
+    attached.attach(Screen(20, 4))
+    with pytest.raises(ValueError):
+        attached.bind(screen)
+
+    # ... and still supports pull API.
+    assert list(stream.events("\x1b[H")) == [("cursor_position", (0, ), {})]
+    stream.feed("\x0f\x1b[Hqux")
+    assert screen.display[0].startswith("qux")
+
+    # b) detached stream is back to normal.
+    stream.detach(screen)
+    assert stream.bound is None and not stream.listeners
+    stream.feed("foo")
+    assert screen.display[0].startswith("qux")
+
+
+def test_bind_statistics():
+    stream = Stream(stats=True)
+    stream.bind(Screen(20, 4))
+    stream.feed("foo\x1b[Hbar")
+    assert stream.statistics()["events"] == {"draw_text": 2,
+                                             "cursor_position": 1}
+
+
+def test_rejected_sequences():
+    # Sequences, the screen doesn't support -- extra parameters or
+    # private flags -- are ignored, and don't affect the rest of the
+    # input, no matter how events are delivered.
+    data = ("\x1b[1;2A\x1b[1;2;3H\x1b[2;3g\x1b[?5A\x1b[?1;2K\x1b[?\n1h"
+            "foo\r\nbar\x1b[?5h")
+
+    class Proxy(object):
+        # Not a batch listener, so events go through ``dispatch()``.
+        def __init__(self, screen):
+            self.screen = screen
+
+        def __getattr__(self, event):
+            return getattr(self.screen, event)
+
+    screens = []
+    for deliver in ["attach", "bind", "proxy"]:
+        screen = Screen(10, 4)
+        stream = Stream(unknown="count")
+        if deliver == "attach":
+            stream.attach(screen)
+        elif deliver == "bind":
+            stream.bind(screen)
+        else:
+            stream.attach(Proxy(screen))
+
+        stream.feed(data)
+        stream.feed("\rbaz\n")
+        assert not stream.flags
+        screens.append(screen)
+
+        if deliver != "attach":
+            # Batch listeners handle events after they're dispatched,
+            # a screen ignores rejected ones.
+            assert stream.unknown_sequences[("rejected", "cursor_up")] == 2
+        else:
+            assert not stream.unknown_sequences
+
+    for screen in screens:
+        assert screen.display == screens[0].display
+        assert mo.DECSCNM in screen.mode
+
+    # Rejected sequences are counted the same, no matter how the input
+    # is split, and reported with their arguments.
+    for chunk_size in [1, 3, 7]:
+        stream = Stream(unknown="count")
+        stream.bind(Screen(10, 4))
+        stream.feed("\x1b[1;2A\x1b[?5A")
+        for idx in range(0, 7, chunk_size):
+            stream.feed("\x1b[1;2A"[idx:idx + chunk_size])
+        assert stream.unknown_sequences == {("rejected", "cursor_up"): 3}
+
+    class Listener(object):
+        def cursor_up(self, count=1):
+            pass
+
+    listener = Listener()
+    listener.debug = handler = argcheck()
+    stream = Stream()
+    stream.attach(listener)
+    stream.feed("\x1b[1;2A")
+    assert handler.args == (1, 2)
+    assert handler.kwargs == {"state": "rejected",
+                              "unhandled": "cursor_up"}
+
+    # "raise" policy re-raises the error and resets the state.
+    stream = Stream(unknown="raise")
+    stream.bind(Screen(10, 4))
+    with pytest.raises(TypeError):
+        stream.feed("\x1b[?5A")
+    assert not stream.flags
+    stream.feed("\r\n")
@@ -15,8 +15,8 @@
     :license: LGPL, see LICENSE for more details.
 """
 
-__all__ = ("Screen",  "DiffScreen", "HistoryScreen",
-           "Stream", "ByteStream", "DebugStream",
+__all__ = ("Screen",  "DiffScreen", "HistoryScreen", "CompactScreen",
+           "Stream", "ByteStream", "DebugStream", "Coalescer",
            "ctrl", "esc", "mo", "g", "c")
 
 from . import (
@@ -26,8 +26,8 @@ from . import (
     graphics as g,
     charsets as c
 )
-from .screens import Screen, DiffScreen, HistoryScreen
-from .streams import Stream, ByteStream, DebugStream
+from .screens import Screen, DiffScreen, HistoryScreen, CompactScreen
+from .streams import Stream, ByteStream, DebugStream, Coalescer
 
 
 if __debug__:
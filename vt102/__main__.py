@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+    vt102.__main__
+    ~~~~~~~~~~~~~~
+
+    Command line tools, available via ``python -m vt102``.
+
+    ``trace`` parses a recorded typescript, optionally printing the
+    decoded events as JSON lines (see :class:`~vt102.recorder.Tracer`),
+    and summarizes the workload:
+
+    .. code-block:: bash
+
+       $ python -m vt102 trace typescript
+       $ python -m vt102 trace --events --only select_graphic_rendition -
+
+    The file is memory mapped and parsed in chunks, so recordings of any
+    size can be traced; ``-`` reads from the standard input.
+
+    :copyright: (c) 2011 by Selectel, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import argparse
+import sys
+
+from .recorder import Tracer
+from .streams import ByteStream
+
+
+class Profile(object):
+    """A listener, which gathers the parts of the workload profile,
+    :meth:`~vt102.streams.Stream.statistics` doesn't cover: SGR codes
+    and text runs.
+    """
+
+    def __init__(self):
+        #: A mapping of SGR codes to the number of times each was set.
+        self.sgr = {}
+        #: Number of ``draw_text`` events and characters they carried.
+        self.runs = self.drawn = 0
+
+    def dispatch_batch(self, events):
+        sgr = self.sgr
+        for event, args, flags in events:
+            if event == "draw_text":
+                self.runs += 1
+                self.drawn += len(args[0])
+            elif event == "select_graphic_rendition":
+                # An SGR without parameters is a reset.
+                for code in args or (0, ):
+                    sgr[code] = sgr.get(code, 0) + 1
+
+    def report(self, stats):
+        """Formats the profile along with stream statistics.
+
+        :param dict stats: a result of
+                           :meth:`~vt102.streams.Stream.statistics`.
+        """
+        total = sum(stats["events"].itervalues())
+        lines = ["bytes: {0}, characters: {1}, events: {2}".format(
+            stats["bytes"], stats["characters"], total)]
+        if total:
+            lines.append("bytes per event: {0:.2f}".format(
+                float(stats["bytes"]) / total))
+        if self.runs:
+            lines.append("average text run: {0:.2f} characters".format(
+                float(self.drawn) / self.runs))
+
+        for title, counts in [("events", stats["events"]),
+                              ("csi finals", stats["csi"]),
+                              ("sgr codes", self.sgr),
+                              ("unknown sequences", stats["unknown"])]:
+            if counts:
+                lines.append("")
+                lines.append(title + ":")
+                lines.extend(_histogram(counts))
+
+        return "\n".join(lines) + "\n"
+
+
+def _histogram(counts):
+    """Formats a mapping of keys to counts, most frequent first."""
+    total = float(sum(counts.itervalues()))
+    for key, count in sorted(counts.iteritems(),
+                             key=lambda item: (-item[1], item[0])):
+        # Unknown sequences are keyed by ``(state, char)`` pairs, which
+        # may contain control characters.
+        label = repr(key) if isinstance(key, tuple) else unicode(key)
+        yield "  {0:<28} {1:>10} {2:>6.1%}".format(label, count,
+                                                  count / total)
+
+
+def trace(path, to, events=False, only=(), chunk_size=65536):
+    """Parses a recorded typescript and writes a workload profile.
+
+    :param unicode path: path to the file, or ``"-"`` for the standard
+                         input.
+    :param file to: a binary file-like object to write to.
+    :param bool events: if ``True``, each event is written as a JSON
+                        line before the profile.
+    :param list only: a list of events to write, see
+                      :class:`~vt102.recorder.Tracer`.
+    :param int chunk_size: number of bytes to parse at once.
+    """
+    stream = ByteStream(unknown="ignore", stats=True)
+    profile = Profile()
+    stream.attach(profile)
+
+    tracer = None
+    if events:
+        tracer = Tracer(to, only=only, buffer_size=chunk_size)
+        stream.attach(tracer)
+
+    if path == "-":
+        while stream.feed_from_fd(sys.stdin.fileno(), chunk_size):
+            pass
+    else:
+        stream.feed_file(path, chunk_size)
+
+    if tracer is not None:
+        tracer.flush()
+        to.write(b"\n")
+
+    to.write(profile.report(stream.statistics()).encode("utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m vt102")
+    commands = parser.add_subparsers()
+
+    trace_parser = commands.add_parser(
+        "trace", help="parse a recording and profile the workload")
+    trace_parser.add_argument("path",
+                              help="a recorded typescript, '-' for stdin")
+    trace_parser.add_argument("-e", "--events", action="store_true",
+                              help="print events as JSON lines")
+    trace_parser.add_argument("--only", action="append", default=[],
+                              metavar="EVENT",
+                              help="print only these events (repeatable)")
+    trace_parser.add_argument("--chunk-size", type=int, default=65536,
+                              help="number of bytes to parse at once")
+    trace_parser.set_defaults(command=trace)
+
+    args = parser.parse_args(argv)
+    try:
+        args.command(args.path, sys.stdout, events=args.events,
+                     only=args.only, chunk_size=args.chunk_size)
+    except IOError as e:
+        parser.exit(1, "{0}: {1}\n".format(parser.prog, e))
+
+
+if __name__ == "__main__":
+    main()
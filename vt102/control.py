@@ -63,3 +63,24 @@ DEL = "\u007f"
 
 #: *Control sequence introducer*: An equavalent for ``ESC [``.
 CSI = "\u009b"
+
+#: *Device control string*: An equivalent for ``ESC P``, starts a string,
+#: terminated by :data:`ST`.
+DCS = "\u0090"
+
+#: *Start of string*: An equivalent for ``ESC X``.
+SOS = "\u0098"
+
+#: *String terminator*: An equivalent for ``ESC \``.
+ST = "\u009c"
+
+#: *Operating system command*: An equivalent for ``ESC ]``, starts a
+#: string, terminated by :data:`ST` or :data:`BEL`, for instance
+#: ``OSC 0;title BEL`` sets window title in `xterm`.
+OSC = "\u009d"
+
+#: *Privacy message*: An equivalent for ``ESC ^``.
+PM = "\u009e"
+
+#: *Application program command*: An equivalent for ``ESC _``.
+APC = "\u009f"
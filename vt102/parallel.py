@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+    vt102.parallel
+    ~~~~~~~~~~~~~~
+
+    This module implements parallel parsing of large recorded
+    typescripts. The input is split into chunks at *sync points* --
+    newlines, after which the parser is most likely back in the
+    default ``"stream"`` state. Chunks are parsed into event batches by
+    a pool of worker processes, while the batches are applied to a
+    single screen sequentially, in order.
+
+    >>> import vt102
+    >>> screen = vt102.Screen(80, 24)
+    >>> parse("typescript", screen, processes=4)  # doctest: +SKIP
+
+    A newline is not always a sync point: it can be a part of an OSC
+    string or even of a CSI sequence. Each worker reports the parser
+    state at the end of its chunk, and if it isn't the initial state,
+    the next chunk is parsed once again, sequentially, starting from
+    the reported state.
+
+    :copyright: (c) 2011 by Selectel, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import mmap
+import multiprocessing
+import os
+from itertools import izip
+
+from .streams import ByteStream
+
+
+def split(data, chunk_size):
+    """Yields ``(start, end)`` offsets of chunks of at least
+    ``chunk_size`` bytes, each ending just after a newline, except for
+    the last one.
+
+    :param data: a string or a memory mapped file to split.
+    :param int chunk_size: minimum number of bytes in a chunk.
+    """
+    start, length = 0, len(data)
+    while start < length:
+        end = data.find(b"\n", start + chunk_size - 1)
+        end = length if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def tokenize(data, state=None, **kwargs):
+    """Parses a chunk of bytes into a list of ``(event, args, flags)``
+    tuples.
+
+    :param bytes data: a chunk to parse.
+    :param tuple state: parser state to start with, see
+                        :meth:`~vt102.streams.Stream.getstate`; the
+                        initial state by default.
+    :returns: a pair of a list of events and parser state at the end
+              of the chunk.
+
+    Other keyword arguments are passed to
+    :class:`~vt102.streams.ByteStream`.
+    """
+    stream = ByteStream(**kwargs)
+    if state is not None:
+        stream.setstate(state)
+
+    return list(stream.events(data, chunk_size=len(data) or 1)), \
+        stream.getstate()
+
+
+def _tokenize(task):
+    """Parses a chunk of a memory mapped file in a worker process."""
+    path, start, end, kwargs = task
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return tokenize(mapped[start:end], **kwargs)
+        finally:
+            mapped.close()
+
+
+def parse(path, screen, processes=None, chunk_size=1 << 22, **kwargs):
+    """Parses a recorded typescript in parallel and applies the events
+    to a given screen.
+
+    .. note::
+
+       Each chunk is decoded from scratch, thus the preferred decoder
+       of a :class:`~vt102.streams.ByteStream` isn't carried over
+       chunk boundaries.
+
+    :param unicode path: path to the file.
+    :param vt102.screens.Screen screen: a screen to apply events to;
+                                        any object with a
+                                        ``dispatch_batch()`` method
+                                        will do.
+    :param int processes: number of worker processes, defaults to the
+                          number of CPUs.
+    :param int chunk_size: minimum number of bytes per chunk.
+    :returns: parser state at the end of the file, which can be passed
+              to :meth:`~vt102.streams.Stream.setstate` to carry on
+              with a live stream.
+
+    Other keyword arguments are passed to
+    :class:`~vt102.streams.ByteStream`.
+    """
+    initial = state = ByteStream(**kwargs).getstate()
+    if not os.path.getsize(path):
+        return state
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        chunks = list(split(mapped, chunk_size))
+        results = pool.imap(_tokenize, [(path, start, end, kwargs)
+                                        for start, end in chunks])
+
+        for (start, end), (events, end_state) in izip(chunks, results):
+            # The preferred decoder index, the last item of the state,
+            # doesn't matter here.
+            if state[:-1] != initial[:-1]:
+                # The previous chunk didn't end at a sync point, so this
+                # one has to be parsed again, right where it left off.
+                events, end_state = tokenize(mapped[start:end], state,
+                                             **kwargs)
+
+            if events:
+                screen.dispatch_batch(events)
+            state = end_state
+    finally:
+        pool.terminate()
+        mapped.close()
+
+    return state
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+    vt102.recorder
+    ~~~~~~~~~~~~~~
+
+    This module implements a compact binary log of the events,
+    dispatched by :class:`~vt102.streams.Stream`, which can later be
+    replayed to any :class:`~vt102.screens.Screen`, without parsing
+    escape sequences all over again.
+
+    >>> import io
+    >>> import vt102
+    >>> log = io.BytesIO()
+    >>> stream = vt102.ByteStream()
+    >>> stream.attach(Recorder(log))
+    >>> stream.feed(b"\\x1b[1mHello world!")
+    >>> screen = vt102.Screen(80, 24)
+    >>> replay(log.getvalue(), screen)
+    >>> screen.display[0].rstrip()
+    u'Hello world!'
+
+    Each event starts with an opcode byte: the lower six bits are an
+    index into :data:`EVENTS` plus one, or ``0`` followed by the event
+    name for events missing from :data:`EVENTS`. If :data:`ARGS` bit
+    is set, the opcode is followed by the number of arguments and the
+    arguments themselves; if :data:`FLAGS` bit is set -- by the number
+    of flags and ``name, value`` pairs. All numbers are unsigned LEB128
+    varints, thus a ``linefeed`` takes a single byte.
+
+    :copyright: (c) 2011 by Selectel, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+from itertools import islice
+
+#: Log header, the last byte is format version.
+MAGIC = b"VT102EV\x01"
+
+#: Events with a single byte opcode. **Append only**, otherwise
+#: existing logs become unreadable.
+EVENTS = [
+    "draw", "draw_text", "debug", "bell", "backspace", "tab", "linefeed",
+    "carriage_return", "shift_out", "shift_in", "reset", "index",
+    "reverse_index", "set_tab_stop", "save_cursor", "restore_cursor",
+    "alignment_display", "insert_characters", "cursor_up", "cursor_down",
+    "cursor_forward", "cursor_back", "cursor_down1", "cursor_up1",
+    "cursor_to_column", "cursor_position", "erase_in_display",
+    "erase_in_line", "insert_lines", "delete_lines", "delete_characters",
+    "erase_characters", "cursor_to_line", "clear_tab_stop", "set_mode",
+    "reset_mode", "select_graphic_rendition", "set_margins", "set-charset",
+    "osc",
+]
+
+OPCODES = dict((event, code) for code, event in enumerate(EVENTS, 1))
+
+#: Opcode bits, marking events with arguments and flags.
+ARGS, FLAGS = 0x80, 0x40
+
+# Value tags, stored in the two lowest bits of a value header.
+INT, TEXT, BOOL, NONE = range(4)
+
+
+def _varint(out, n):
+    """Appends an unsigned LEB128 encoded integer to a bytearray."""
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _value(out, value):
+    """Appends a tagged argument or flag value to a bytearray."""
+    if value is True or value is False:
+        _varint(out, value << 2 | BOOL)
+    elif isinstance(value, (int, long)):
+        _varint(out, value << 2 | INT)
+    elif value is None:
+        out.append(NONE)
+    else:
+        data = value.encode("utf-8")
+        _varint(out, len(data) << 2 | TEXT)
+        out.extend(data)
+
+
+def encode(events, out=None):
+    """Encodes an iterable of ``(event, args, flags)`` tuples.
+
+    :param events: events to encode.
+    :param bytearray out: a buffer to append encoded events to, a new
+                          one is created by default.
+    """
+    out = bytearray() if out is None else out
+    for event, args, flags in events:
+        code = OPCODES.get(event, 0)
+        out.append(code | (ARGS if args else 0) | (FLAGS if flags else 0))
+        if not code:
+            _value(out, event)
+
+        if args:
+            _varint(out, len(args))
+            for arg in args:
+                _value(out, arg)
+
+        if flags:
+            _varint(out, len(flags))
+            for name, value in flags.iteritems():
+                _value(out, name)
+                _value(out, value)
+
+    return out
+
+
+def decode(data):
+    """Lazily decodes a log produced by :class:`Recorder` into
+    ``(event, args, flags)`` tuples.
+
+    :param bytes data: encoded log, starting with :data:`MAGIC`.
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError("not a vt102 event log")
+
+    buf = bytearray(data)
+    idx, length = len(MAGIC), len(buf)
+
+    def varint():
+        n = shift = 0
+        while True:
+            byte = buf[idx + shift // 7]
+            n |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                return n, idx + shift // 7
+
+    def value():
+        header, end = varint()
+        tag, n = header & 3, header >> 2
+        if tag == INT:
+            return n, end
+        elif tag == BOOL:
+            return bool(n), end
+        elif tag == NONE:
+            return None, end
+        else:
+            return buf[end:end + n].decode("utf-8"), end + n
+
+    while idx < length:
+        code = buf[idx]
+        idx += 1
+        if code & 0x3f:
+            event = EVENTS[(code & 0x3f) - 1]
+        else:
+            event, idx = value()
+
+        args = []
+        if code & ARGS:
+            count, idx = varint()
+            for _ in xrange(count):
+                arg, idx = value()
+                args.append(arg)
+
+        flags = {}
+        if code & FLAGS:
+            count, idx = varint()
+            for _ in xrange(count):
+                name, idx = value()
+                flags[name], idx = value()
+
+        yield event, tuple(args), flags
+
+
+class Recorder(object):
+    """A listener, which writes every event it gets to a binary log;
+    see :func:`encode` for the format details.
+
+    :param file to: a binary file-like object to write the log to,
+                    starting with :data:`MAGIC`.
+    """
+
+    def __init__(self, to):
+        self.to = to
+        self.to.write(MAGIC)
+
+    def dispatch_batch(self, events):
+        """Encodes and writes a batch of events in a single call."""
+        self.to.write(bytes(encode(events)))
+
+
+class Tracer(object):
+    """A listener for tracing streams in production: events are
+    filtered, sampled and written in batches, either as JSON lines
+
+    .. code-block:: javascript
+
+       ["cursor_position", [5, 10], {}]
+       ["set_mode", [25], {"private": true}]
+
+    or in the binary format of :class:`Recorder`.
+
+    >>> import io
+    >>> import vt102
+    >>> out = io.BytesIO()
+    >>> stream = vt102.Stream()
+    >>> stream.attach(Tracer(out, only=["cursor_position"]))
+    >>> stream.feed(u"\u001b[5;10Hfoo")
+    >>> out.getvalue()
+    '["cursor_position",[5,10],{}]\\n'
+
+    :param file to: a file-like object to write events to.
+    :param unicode format: either ``"json"`` or ``"binary"``.
+    :param list only: a list of events to trace, empty by default,
+                      which means -- trace all events.
+    :param int sample: trace only every n-th event, which passed the
+                       ``only`` filter.
+    :param int buffer_size: number of bytes to buffer before writing
+                            them out; see :meth:`flush`.
+    """
+
+    formats = frozenset(["json", "binary"])
+
+    def __init__(self, to, format="json", only=(), sample=1,
+                 buffer_size=0):
+        if format not in self.formats:
+            raise ValueError("unknown format: %r" % format)
+
+        self.to = to
+        self.format = format
+        self.only = frozenset(only)
+        self.sample = sample
+        self.buffer_size = buffer_size
+
+        self.dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+        #: Number of events seen so far, modulo ``sample``.
+        self.skipped = 0
+        self.buffer = bytearray()
+        if format == "binary":
+            self.to.write(MAGIC)
+
+    def dispatch_batch(self, events):
+        """Filters, samples and encodes a batch of events."""
+        only = self.only
+        if only:
+            events = [item for item in events if item[0] in only]
+
+        if self.sample > 1:
+            # Continue counting where the previous batch left off.
+            offset = -self.skipped % self.sample
+            self.skipped = (self.skipped + len(events)) % self.sample
+            events = list(islice(events, offset, None, self.sample))
+
+        if self.format == "json":
+            dumps = self.dumps
+            for event, args, flags in events:
+                # Non-ASCII characters are escaped, so the result can be
+                # safely encoded to bytes.
+                self.buffer.extend(dumps([event, args, flags]).encode("ascii"))
+                self.buffer.extend(b"\n")
+        else:
+            encode(events, self.buffer)
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Writes out the buffered events."""
+        if self.buffer:
+            self.to.write(bytes(self.buffer))
+            del self.buffer[:]
+
+
+def replay(data, screen, batch_size=1024):
+    """Replays a log, produced by :class:`Recorder`, to a given screen.
+
+    :param bytes data: encoded log, starting with :data:`MAGIC`.
+    :param vt102.screens.Screen screen: a screen to replay events to;
+                                        any object with a
+                                        ``dispatch_batch()`` method
+                                        will do.
+    :param int batch_size: number of events to pass to the screen at
+                           once.
+    """
+    batch = []
+    for event in decode(data):
+        batch.append(event)
+        if len(batch) == batch_size:
+            screen.dispatch_batch(batch)
+            batch = []
+
+    if batch:
+        screen.dispatch_batch(batch)
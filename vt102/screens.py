@@ -24,8 +24,9 @@ from __future__ import absolute_import, print_function, unicode_literals
 import copy
 import math
 import operator
+from array import array
 from collections import namedtuple, deque
-from itertools import islice, repeat
+from itertools import imap, islice, repeat
 
 from . import modes as mo, graphics as g, charsets as c
 
@@ -66,6 +67,8 @@ class Char(_Char):
     """A wrapper around :class:`_Char`, providing some useful defaults
     for most of the attributes.
     """
+    __slots__ = ()
+
     def __new__(cls, data, fg="default", bg="default", bold=False,
                 italics=False, underscore=False, reverse=False,
                 strikethrough=False):
@@ -88,6 +91,130 @@ class Cursor(object):
         self.x, self.y, self.attrs = x, y, attrs
 
 
+class CompactLine(object):
+    """A screen line, which stores characters in two arrays: code
+    points and ids of character attributes -- all :class:`Char` fields,
+    but ``data`` -- thus taking six bytes per character. Attributes are
+    interned in :attr:`attributes`, shared by all lines.
+
+    Otherwise, it behaves like a :func:`list` of :class:`Char`, which
+    are created on access.
+
+    >>> line = CompactLine([Char("f", bold=True), Char("o")])
+    >>> line[0] == Char("f", bold=True)
+    True
+    >>> line.text()
+    u'fo'
+
+    :param iterable chars: characters to populate the line with.
+    """
+    __slots__ = ["codes", "attrs"]
+
+    #: Distinct character attributes seen so far; an attribute id is an
+    #: index into this list.
+    attributes = []
+
+    # A mapping of character attributes to their ids.
+    _attribute_ids = {}
+
+    def __init__(self, chars=()):
+        self.codes, self.attrs = self._encode(chars)
+
+    @classmethod
+    def _intern(cls, char):
+        """Returns an id of the attributes of a given character."""
+        key = char[1:]
+        idx = cls._attribute_ids.get(key)
+        if idx is None:
+            idx = cls._attribute_ids[key] = len(cls.attributes)
+            cls.attributes.append(key)
+        return idx
+
+    @classmethod
+    def run(cls, text, attrs):
+        """Returns a line of characters with the same attributes.
+
+        :param unicode text: characters of the line.
+        :param vt102.screens.Char attrs: a character, which attributes
+                                         are used.
+        """
+        line = cls.__new__(cls)
+        line.codes = array(b"I", map(ord, text))
+        line.attrs = array(b"H", [cls._intern(attrs)]) * len(text)
+        return line
+
+    @classmethod
+    def _encode(cls, chars):
+        """Encodes an iterable of characters into a pair of arrays."""
+        if isinstance(chars, CompactLine):
+            return chars.codes[:], chars.attrs[:]
+
+        chars = list(chars)
+
+        # Blank lines and erasing produce runs of the same character.
+        if chars and chars.count(chars[0]) == len(chars):
+            return (array(b"I", [ord(chars[0][0])]) * len(chars),
+                    array(b"H", [cls._intern(chars[0])]) * len(chars))
+
+        return (array(b"I", [ord(char[0]) for char in chars]),
+                array(b"H", map(cls._intern, chars)))
+
+    def _char(self, code, idx):
+        return Char._make((unichr(code), ) + self.attributes[idx])
+
+    def text(self):
+        """Returns the characters of the line as a unicode string."""
+        return "".join(imap(unichr, self.codes))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return imap(self._char, self.codes, self.attrs)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            line = CompactLine.__new__(type(self))
+            line.codes, line.attrs = self.codes[idx], self.attrs[idx]
+            return line
+
+        return self._char(self.codes[idx], self.attrs[idx])
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            self.codes[idx], self.attrs[idx] = self._encode(value)
+        else:
+            self.codes[idx], self.attrs[idx] = \
+                ord(value[0]), self._intern(value)
+
+    def __delitem__(self, idx):
+        del self.codes[idx]
+        del self.attrs[idx]
+
+    def extend(self, chars):
+        codes, attrs = self._encode(chars)
+        self.codes.extend(codes)
+        self.attrs.extend(attrs)
+
+    def __add__(self, chars):
+        line = self[:]
+        line.extend(chars)
+        return line
+
+    def __eq__(self, other):
+        if isinstance(other, CompactLine):
+            return self.codes == other.codes and self.attrs == other.attrs
+        return list(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, list(self))
+
+
 
 class Screen(list):
     """
@@ -119,16 +246,39 @@ class Screen(list):
          For a description of the presentational component, implemented
          by ``Screen``.
     """
+    __slots__ = ["savepoints", "lines", "columns", "mode", "margins",
+                 "g0_charset", "g1_charset", "charset", "tabstops",
+                 "cursor", "__dict__", "__weakref__"]
+
     #: A plain empty character with default foreground and background
     #: colors.
     default_char = Char(data=" ", fg="default", bg="default")
 
+    #: Modes, which are set after :meth:`reset`.
+    default_mode = frozenset([mo.DECAWM, mo.DECTCEM, mo.LNM])
+
     #: An inifinite sequence of default characters, used for populating
     #: new lines and columns.
     default_line = repeat(default_char)
 
+    #: A type of screen lines, constructed from a list of characters;
+    #: see :class:`CompactScreen` for an alternative to :func:`list`.
+    line_type = list
+
+    #: Maximum number of distinct cursor attributes and of characters
+    #: per attributes to intern; see :meth:`intern`.
+    intern_limit = 1024
+
+    # A cache for :meth:`_draws_each`.
+    _draw_overrides = {}
+
+    # Interned characters, shared between screens: a mapping of cursor
+    # attributes to a pair of the interned attributes and a mapping of
+    # characters drawn with them.
+    _interned = {}
+
     def __init__(self, columns, lines):
-        self.savepoints = []
+        self.savepoints = ()  # A list is created on first save.
         self.lines, self.columns = lines, columns
         self.reset()
 
@@ -147,6 +297,46 @@ class Screen(list):
         return ["".join(map(operator.attrgetter("data"), line))
                 for line in self]
 
+    def dispatch_batch(self, events):
+        """Handles a batch of ``(event, args, flags)`` tuples, collected
+        by :class:`~vt102.streams.Stream` during a single ``feed()``.
+
+        Unknown events and events with arguments, the handler doesn't
+        accept, are ignored; ``draw_text`` falls back to
+        :meth:`draw`, if the screen doesn't define ``draw_text()``.
+
+        :param list events: events to handle, in order.
+        """
+        handlers = {}
+        for event, args, flags in events:
+            handler = handlers.get(event)
+            if handler is None:
+                handler = getattr(self, event, None)
+                if handler is None:
+                    if event == "draw_text":
+                        handler = self._draw_each
+                    else:
+                        handler = self._ignore
+                handlers[event] = handler
+
+            try:
+                if flags:
+                    handler(*args, **flags)
+                else:
+                    handler(*args)
+            except TypeError:
+                # Same as for unknown events: a sequence the handler
+                # doesn't support is ignored.
+                pass
+
+    def _draw_each(self, text):
+        """Draws a run of characters one by one."""
+        for char in text:
+            self.draw(char)
+
+    def _ignore(self, *args, **flags):
+        """A handler for the events screen doesn't know about."""
+
     def reset(self):
         """Resets the terminal to its initial state.
 
@@ -163,9 +353,8 @@ class Screen(list):
            and tabstops should be reset as well, thanks to
            :manpage:`xterm` -- we now know that.
         """
-        self[:] = (take(self.columns, self.default_line)
-                   for _ in xrange(self.lines))
-        self.mode = set([mo.DECAWM, mo.DECTCEM, mo.LNM, mo.DECTCEM])
+        self[:] = (self.blank_line() for _ in xrange(self.lines))
+        self.mode = set(self.default_mode)
         self.margins = Margins(0, self.lines - 1)
 
         # According to VT220 manual and ``linux/drivers/tty/vt.c``
@@ -208,8 +397,7 @@ class Screen(list):
         # a) if the current display size is less than the requested
         #    size, add lines to the bottom.
         if diff < 0:
-            self.extend(take(self.columns, self.default_line)
-                        for _ in xrange(diff, 0))
+            self.extend(self.blank_line() for _ in xrange(diff, 0))
         # b) if the current display size is greater than requested
         #    size, take lines off the top.
         elif diff > 0:
@@ -232,6 +420,16 @@ class Screen(list):
         self.margins = Margins(0, self.lines - 1)
         self.reset_mode(mo.DECOM)
 
+    def blank_line(self, char=None):
+        """Returns a new line of :attr:`line_type`, filled with a given
+        character.
+
+        :param vt102.screens.Char char: a character to fill the line
+                                        with, :attr:`default_char` by
+                                        default.
+        """
+        return self.line_type([char or self.default_char] * self.columns)
+
     def set_margins(self, top=None, bottom=None):
         """Selects top and bottom margins for the scrolling region.
 
@@ -302,7 +500,8 @@ class Screen(list):
 
         # Mark all displayed characters as reverse.
         if mo.DECSCNM in modes:
-            self[:] = ([char._replace(reverse=True) for char in line]
+            self[:] = (self.line_type([char._replace(reverse=True)
+                                       for char in line])
                        for line in self)
             self.select_graphic_rendition(g._SGR["+reverse"])
 
@@ -329,7 +528,8 @@ class Screen(list):
             self.cursor_position()
 
         if mo.DECSCNM in modes:
-            self[:] = ([char._replace(reverse=False) for char in line]
+            self[:] = (self.line_type([char._replace(reverse=False)
+                                       for char in line])
                        for line in self)
             self.select_graphic_rendition(g._SGR["-reverse"])
 
@@ -351,11 +551,13 @@ class Screen(list):
         char = char.translate(self.charset)
 
         # If this was the last column in a line and auto wrap mode is
-        # enabled, move the cursor to the next line. Otherwise replace
+        # enabled, move the cursor to the beginning of the next line,
+        # regardless of :data:`~vt102.modes.LNM`. Otherwise replace
         # characters already displayed with newly entered.
         if self.cursor.x == self.columns:
             if mo.DECAWM in self.mode:
                 self.linefeed()
+                self.carriage_return()
             else:
                 self.cursor.x -= 1
 
@@ -365,11 +567,112 @@ class Screen(list):
         if mo.IRM in self.mode:
             self.insert_characters(1)
 
-        self[self.cursor.y][self.cursor.x] = self.cursor.attrs._replace(data=char)
-
         # .. note:: We can't use :meth:`cursor_forward()`, because that
         #           way, we'll never know when to linefeed.
-        self.cursor.x += 1
+        self._draw_cells([self.intern(char)])
+
+    def draw_text(self, text):
+        """Displays a run of characters, as if each one was passed to
+        :meth:`draw`, but with a single slice assignment per line.
+
+        .. note::
+
+           If a subclass overrides :meth:`draw`, but not
+           :meth:`draw_text`, characters are passed to :meth:`draw` one
+           by one.
+
+        :param unicode text: characters to display.
+        """
+        # Insert mode shifts the rest of the line for every character,
+        # not worth a special case.
+        if mo.IRM in self.mode or self._draws_each():
+            return self._draw_each(text)
+
+        cells = self._cells(text.translate(self.charset))
+        cursor, columns = self.cursor, self.columns
+        if mo.DECAWM not in self.mode:
+            if cursor.x == columns:
+                cursor.x -= 1
+
+            # Without auto wrap, characters past the right margin
+            # overwrite the last column, so only the last one is left.
+            room = columns - cursor.x
+            if len(cells) > room:
+                cells[room - 1:] = cells[-1:]
+
+            return self._draw_cells(cells)
+
+        idx, length = 0, len(cells)
+        while idx < length:
+            if cursor.x == columns:
+                self.linefeed()
+                self.carriage_return()
+
+            segment = cells[idx:idx + columns - cursor.x]
+            self._draw_cells(segment)
+            idx += len(segment)
+
+    def _draw_cells(self, cells):
+        """Writes characters, which fit the rest of the cursor line, at
+        the cursor position and advances the cursor.
+        """
+        cursor = self.cursor
+        self[cursor.y][cursor.x:cursor.x + len(cells)] = cells
+        cursor.x += len(cells)
+
+    @classmethod
+    def _draws_each(cls):
+        """Returns ``True`` if :meth:`draw` is overridden in a subclass,
+        which doesn't override :meth:`draw_text` as well.
+        """
+        draws_each = cls._draw_overrides.get(cls)
+        if draws_each is None:
+            for klass in cls.__mro__:
+                if "draw_text" in vars(klass) or "draw" in vars(klass):
+                    draws_each = "draw_text" not in vars(klass)
+                    break
+            cls._draw_overrides[cls] = draws_each
+        return draws_each
+
+    def _cells(self, text):
+        """Returns a sequence of characters, ready to be assigned to a
+        slice of a line, for a given run of translated text.
+        """
+        _, chars = self._intern_attrs(self.cursor.attrs)
+        return [chars.get(char) or self.intern(char) for char in text]
+
+    def intern(self, data):
+        """Returns a :class:`Char` with a given ``data`` and cursor
+        attributes. Characters are interned, thus identical cells share
+        a single object, instead of a new one allocated per cell.
+
+        >>> screen = Screen(80, 24)
+        >>> screen.intern(u"a") is Screen(80, 24).intern(u"a")
+        True
+
+        :param unicode data: a character to display.
+        """
+        attrs, chars = self._intern_attrs(self.cursor.attrs)
+        char = chars.get(data)
+        if char is None:
+            if len(chars) >= self.intern_limit:
+                chars.clear()
+            char = chars[data] = attrs._replace(data=data)
+        return char
+
+    def _intern_attrs(self, attrs):
+        """Returns a pair of interned attributes, equal to the given
+        ones, and a mapping of characters, interned with them.
+        """
+        interned = self._interned
+        entry = interned.get(attrs)
+        if entry is None:
+            # Nothing is lost, if the cache is cleared: equal characters
+            # simply stop sharing memory.
+            if len(interned) >= self.intern_limit:
+                interned.clear()
+            entry = interned[attrs] = attrs, {}
+        return entry
 
     def carriage_return(self):
         """Move the cursor to the beginning of the current line."""
@@ -383,7 +686,7 @@ class Screen(list):
 
         if self.cursor.y == bottom:
             self.pop(top)
-            self.insert(bottom, take(self.columns, self.default_line))
+            self.insert(bottom, self.blank_line())
         else:
             self.cursor_down()
 
@@ -395,7 +698,7 @@ class Screen(list):
 
         if self.cursor.y == top:
             self.pop(bottom)
-            self.insert(top, take(self.columns, self.default_line))
+            self.insert(top, self.blank_line())
         else:
             self.cursor_up()
 
@@ -429,6 +732,8 @@ class Screen(list):
 
     def save_cursor(self):
         """Push the current cursor position onto the stack."""
+        if not self.savepoints:
+            self.savepoints = []
         self.savepoints.append(Savepoint(copy.copy(self.cursor),
                                          self.g0_charset,
                                          self.g1_charset,
@@ -465,15 +770,16 @@ class Screen(list):
 
         :param count: number of lines to delete.
         """
-        count = count or 1
         top, bottom = self.margins
 
         # If cursor is outside scrolling margins it -- do nothin'.
         if top <= self.cursor.y <= bottom:
-            #                           v +1, because xrange() is exclusive.
-            for line in xrange(self.cursor.y, min(bottom + 1, self.cursor.y + count)):
-                self.pop(bottom)
-                self.insert(line, take(self.columns, self.default_line))
+            #                            v -- +1 to include the bottom margin.
+            count = min(count or 1, bottom - self.cursor.y + 1)
+            del self[bottom - count + 1:bottom + 1]
+            self[self.cursor.y:self.cursor.y] = [
+                self.blank_line() for _ in xrange(count)
+            ]
 
             self.carriage_return()
 
@@ -485,16 +791,16 @@ class Screen(list):
 
         :param int count: number of lines to delete.
         """
-        count = count or 1
         top, bottom = self.margins
 
         # If cursor is outside scrolling margins it -- do nothin'.
         if top <= self.cursor.y <= bottom:
-            #                v -- +1 to include the bottom margin.
-            for _ in xrange(min(bottom - self.cursor.y + 1, count)):
-                self.pop(self.cursor.y)
-                self.insert(bottom, list(
-                    repeat(self.cursor.attrs, self.columns)))
+            #                            v -- +1 to include the bottom margin.
+            count = min(count or 1, bottom - self.cursor.y + 1)
+            del self[self.cursor.y:self.cursor.y + count]
+            self[bottom - count + 1:bottom - count + 1] = [
+                self.blank_line(self.cursor.attrs) for _ in xrange(count)
+            ]
 
             self.carriage_return()
 
@@ -506,11 +812,10 @@ class Screen(list):
 
         :param int count: number of characters to insert.
         """
-        count = count or 1
-
-        for _ in xrange(min(self.columns - self.cursor.y, count)):
-            self[self.cursor.y].insert(self.cursor.x, self.cursor.attrs)
-            self[self.cursor.y].pop()
+        count = min(count or 1, self.columns - self.cursor.x)
+        line = self[self.cursor.y]
+        line[self.cursor.x:self.cursor.x] = [self.cursor.attrs] * count
+        del line[self.columns:]
 
     def delete_characters(self, count=None):
         """Deletes the indicated # of characters, starting with the
@@ -520,11 +825,10 @@ class Screen(list):
 
         :param int count: number of characters to delete.
         """
-        count = count or 1
-
-        for _ in xrange(min(self.columns - self.cursor.x, count)):
-            self[self.cursor.y].pop(self.cursor.x)
-            self[self.cursor.y].append(self.cursor.attrs)
+        count = min(count or 1, self.columns - self.cursor.x)
+        line = self[self.cursor.y]
+        del line[self.cursor.x:self.cursor.x + count]
+        line.extend([self.cursor.attrs] * count)
 
     def erase_characters(self, count=None):
         """Erases the indicated # of characters, starting with the
@@ -540,10 +844,9 @@ class Screen(list):
            ``xterm`` and ``ROTE`` completely ignore this. Same applies
            too all ``erase_*()`` and ``delete_*()`` methods.
         """
-        count = count or 1
-
-        for column in xrange(self.cursor.x, min(self.cursor.x + count, self.columns)):
-            self[self.cursor.y][column] = self.cursor.attrs
+        count = min(count or 1, self.columns - self.cursor.x)
+        self[self.cursor.y][self.cursor.x:self.cursor.x + count] = \
+            [self.cursor.attrs] * count
 
     def erase_in_line(self, type_of=0, private=False):
         """Erases a line in a specific way.
@@ -555,22 +858,27 @@ class Screen(list):
             * ``1`` -- Erases from beginning of line to cursor, including cursor
               position.
             * ``2`` -- Erases complete line.
+
+            Other values are ignored.
         :param bool private: when ``True`` character attributes aren left
                              unchanged **not implemented**.
         """
-        interval = (
+        if type_of not in [0, 1, 2]:
+            return
+
+        start, stop = (
             # a) erase from the cursor to the end of line, including
             # the cursor,
-            xrange(self.cursor.x, self.columns),
+            (self.cursor.x, self.columns),
             # b) erase from the beginning of the line to the cursor,
             # including it,
-            xrange(0, self.cursor.x + 1),
+            (0, self.cursor.x + 1),
             # c) erase the entire line.
-            xrange(0, self.columns)
+            (0, self.columns)
         )[type_of]
 
-        for column in interval:
-            self[self.cursor.y][column] = self.cursor.attrs
+        stop = min(stop, self.columns)
+        self[self.cursor.y][start:stop] = [self.cursor.attrs] * (stop - start)
 
     def erase_in_display(self, type_of=0, private=False):
         """Erases display in a specific way.
@@ -583,9 +891,14 @@ class Screen(list):
               including cursor position.
             * ``2`` -- Erases complete display. All lines are erased
               and changed to single-width. Cursor does not move.
+
+            Other values are ignored.
         :param bool private: when ``True`` character attributes aren left
                              unchanged **not implemented**.
         """
+        if type_of not in [0, 1, 2]:
+            return
+
         interval = (
             # a) erase from cursor to the end of the display, including
             # the cursor,
@@ -598,8 +911,7 @@ class Screen(list):
         )[type_of]
 
         for line in interval:
-            self[line][:] = \
-                (self.cursor.attrs for _ in xrange(self.columns))
+            self[line][:] = [self.cursor.attrs] * self.columns
 
         # In case of 0 or 1 we have to erase the line with the cursor.
         if type_of in [0, 1]:
@@ -773,7 +1085,39 @@ class Screen(list):
             elif not attr:
                 replace = self.default_char._asdict()
 
-        self.cursor.attrs = self.cursor.attrs._replace(**replace)
+        # Attributes are interned as well, so that the cells erased with
+        # them share a single object.
+        self.cursor.attrs, _ = \
+            self._intern_attrs(self.cursor.attrs._replace(**replace))
+
+
+class CompactScreen(Screen):
+    """A screen, which stores lines as :class:`CompactLine` instead of
+    lists of :class:`Char` -- six bytes per character, no matter how
+    many characters were drawn. ``screen[y][x]`` and :attr:`display`
+    return the same data as for :class:`Screen`, but each
+    :class:`Char` is created on access.
+
+    >>> screen = CompactScreen(80, 24)
+    >>> screen.draw(u"!")
+    >>> screen[0][0].data, screen.display[0][:2]
+    (u'!', u'! ')
+
+    .. note::
+
+       Other screens can use the same storage by setting
+       :attr:`~Screen.line_type` to :class:`CompactLine`.
+    """
+    __slots__ = ()
+
+    line_type = CompactLine
+
+    @property
+    def display(self):
+        return [line.text() for line in self]
+
+    def _cells(self, text):
+        return self.line_type.run(text, self.cursor.attrs)
 
 
 class DiffScreen(Screen):
@@ -791,6 +1135,8 @@ class DiffScreen(Screen):
        >>> screen.dirty
        set([0])
     """
+    __slots__ = ["dirty"]
+
     def __init__(self, *args):
         self.dirty = set()
         super(DiffScreen, self).__init__(*args)
@@ -813,9 +1159,11 @@ class DiffScreen(Screen):
         self.dirty.update(xrange(self.lines))
         super(DiffScreen, self).resize(*args, **kwargs)
 
-    def draw(self, *args):
+    def _draw_cells(self, *args):
+        # Both :meth:`draw` and :meth:`draw_text` end up here, once per
+        # line written.
         self.dirty.add(self.cursor.y)
-        super(DiffScreen, self).draw(*args)
+        super(DiffScreen, self)._draw_cells(*args)
 
     def index(self):
         if self.cursor.y == self.margins.bottom:
@@ -853,13 +1201,14 @@ class DiffScreen(Screen):
         self.dirty.add(self.cursor.y)
         super(DiffScreen, self).erase_in_line(*args)
 
-    def erase_in_display(self, type_of=0):
-        self.dirty.update((
-            xrange(self.cursor.y + 1, self.lines),
-            xrange(0, self.cursor.y),
-            xrange(0, self.lines)
-        )[type_of])
-        super(DiffScreen, self).erase_in_display(type_of)
+    def erase_in_display(self, type_of=0, private=False):
+        if type_of in [0, 1, 2]:
+            self.dirty.update((
+                xrange(self.cursor.y + 1, self.lines),
+                xrange(0, self.cursor.y),
+                xrange(0, self.lines)
+            )[type_of])
+        super(DiffScreen, self).erase_in_display(type_of, private)
 
     def alignment_display(self):
         self.dirty.update(xrange(self.cursor.y, self.lines))
@@ -880,6 +1229,7 @@ class HistoryScreen(Screen):
 
        A pair of history queues for top and bottom margins accordingly.
     """
+    __slots__ = ["page", "pages", "history"]
 
     def __init__(self, columns, lines, pages=10):
         super(HistoryScreen, self).__init__(columns, lines)
@@ -28,9 +28,18 @@
 from __future__ import absolute_import, unicode_literals
 
 import codecs
+import functools
+import io
+import mmap
+import os
+import re
 import sys
 
-from . import control as ctrl, escape as esc
+from . import control as ctrl, escape as esc, modes as mo
+
+
+#: Types :class:`ByteStream` accepts as input.
+binary_types = (bytes, bytearray, memoryview, buffer)
 
 
 class Stream(object):
@@ -48,7 +57,40 @@ class Stream(object):
         `man console_codes <http://linux.die.net/man/4/console_codes>`_
             For details on console codes listed bellow in :attr:`basic`,
             :attr:`escape`, :attr:`csi` and :attr:`sharp`.
+
+    :param unicode unknown: what to do with unknown sequences:
+
+        * ``"debug"`` -- dispatch a ``"debug"`` event, this is the
+          default, unless Python is running with ``-O``;
+        * ``"ignore"`` -- silently skip the sequence;
+        * ``"count"`` -- skip the sequence, incrementing a counter in
+          :attr:`unknown_sequences`;
+        * ``"sample"`` -- same as ``"count"``, but also dispatch a
+          ``"debug"`` event for every :attr:`sample_rate`-th occurence
+          of each sequence;
+        * ``"raise"`` -- raise :exc:`KeyError`, the default when running
+          with ``-O``.
+
+        The same policy applies to sequences a listener doesn't support,
+        i.e. the ones its handler rejects with :exc:`TypeError`, for
+        instance, because of a ``private`` flag or extra parameters;
+        these are counted as ``("rejected", event)`` pairs, dispatched
+        as ``"debug"`` events with the rejected arguments and re-raised
+        with ``"raise"`` policy. Batch listeners, including
+        :class:`~vt102.screens.Screen` attached with :meth:`attach`,
+        get the events after they're dispatched and handle rejections
+        themselves -- a screen ignores them regardless of the policy.
+
+    :param bool stats: when ``True``, the stream counts consumed input,
+                       dispatched events and CSI sequences; see
+                       :meth:`statistics`.
     """
+    # Instance ``__dict__`` is only created when something, for
+    # instance :meth:`bind` or :meth:`events`, overrides a method.
+    __slots__ = ["unknown", "counters", "unknown_sequences", "transitions",
+                 "text_run", "string_run", "listeners", "routes",
+                 "batches", "bound", "state", "flags", "params", "current",
+                 "__dict__", "__weakref__"]
 
     #: Control sequences, which don't require any arguments.
     basic = {
@@ -108,18 +150,168 @@ class Stream(object):
         esc.HPA: "cursor_to_column",
     }
 
-    def __init__(self):
-        self.handlers = {
-            "stream": self._stream,
-            "escape": self._escape,
-            "arguments": self._arguments,
-            "sharp": self._sharp,
-            "charset": self._charset
-        }
+    #: A complete CSI sequence without intermediate characters, which
+    #: can be dispatched without going through the state machine, see
+    #: :meth:`_feed`.
+    sequence = re.compile(
+        "(?:\x1b\\[|\x9b)(\\??)([0-9;]{0,64})([\x40-\x7e])")
+
+    #: Maximum length of an ``OSC`` string, passed to ``osc`` event
+    #: handlers; the rest of the string is skipped.
+    osc_limit = 4096
+
+    #: Maximum number of CSI parameters, the rest are ignored.
+    params_limit = 32
+
+    #: Policies for handling unknown sequences, see :meth:`__init__`.
+    unknown_policies = frozenset(["debug", "ignore", "count", "sample",
+                                  "raise"])
 
+    #: With ``"sample"`` policy only every n-th occurence of an unknown
+    #: sequence is dispatched as a ``"debug"`` event.
+    sample_rate = 1000
+
+    def __init__(self, unknown=None, stats=False):
+        self.unknown = unknown or ("debug" if __debug__ else "raise")
+        if self.unknown not in self.unknown_policies:
+            raise ValueError("unknown policy: %r" % self.unknown)
+
+        #: Statistics counters, ``None`` unless enabled.
+        self.counters = None
+        if stats:
+            self.counters = {"characters": 0, "bytes": 0, "events": {},
+                             "csi": {}, "params": 0}
+
+        #: A mapping of ``(state, char)`` pairs to the number of times
+        #: the sequence wasn't recognized.
+        self.unknown_sequences = {}
+
+        self.transitions, self.text_run, self.string_run = self._compile()
         self.listeners = []
+        self.routes = {}
+        self.batches = []
+
+        #: A listener, bound with :meth:`bind`, if any.
+        self.bound = None
         self.reset()
 
+    @classmethod
+    def _compile(cls):
+        """Precomputes a transition table from :attr:`basic`,
+        :attr:`escape`, :attr:`sharp` and :attr:`csi`.
+
+        The table maps each state to a ``(mapping, default)`` pair,
+        where ``mapping`` resolves a character directly to an
+        ``(action, arg)`` pair and ``default`` is used for characters
+        missing from the ``mapping``. An action is called as
+        ``action(stream, char, arg)``.
+
+        The table and two regular expressions, matching runs of
+        printable characters and string sequence payload, are cached on
+        the class and only rebuilt when one of the tables above changes.
+        """
+        key = tuple(frozenset(table.items())
+                    for table in [cls.basic, cls.escape, cls.sharp, cls.csi])
+        compiled = cls.__dict__.get("_compiled")
+        if compiled is not None and compiled[0] == key:
+            return compiled[1:]
+
+        def action(name):
+            return getattr(cls, name).__func__
+
+        (draw, ignore, enter, emit, control, charset_mode, charset,
+         private, digit, separator, csi, abort, unhandled, payload,
+         string_end, string_escape, terminate) = map(action, [
+             "_draw", "_ignore", "_enter", "_emit", "_control",
+             "_charset_mode", "_charset", "_private", "_digit",
+             "_separator", "_csi", "_abort", "_unhandled", "_payload",
+             "_string_end", "_string_escape", "_terminate"
+        ])
+
+        # Note the order of updates below: control characters from
+        # :attr:`basic` take precedence over everything else in the
+        # default state, while in other states hardcoded transitions
+        # can't be overriden by the tables.
+        stream = {
+            ctrl.NUL: (ignore, None),
+            ctrl.DEL: (ignore, None),
+            ctrl.ESC: (enter, "escape"),
+            ctrl.CSI: (enter, "arguments"),
+            ctrl.OSC: (enter, "osc"),
+            ctrl.DCS: (enter, "string"),
+            ctrl.SOS: (enter, "string"),
+            ctrl.PM: (enter, "string"),
+            ctrl.APC: (enter, "string")
+        }
+        stream.update((char, (emit, event))
+                      for char, event in cls.basic.items())
+
+        escape = dict((char, (emit, event))
+                      for char, event in cls.escape.items())
+        escape.update({
+            "#": (enter, "sharp"),
+            "[": (enter, "arguments"),
+            "(": (charset_mode, None),
+            ")": (charset_mode, None),
+            "]": (enter, "osc"),
+            "P": (enter, "string"),
+            "X": (enter, "string"),
+            "^": (enter, "string"),
+            "_": (enter, "string"),
+            # The second half of ``ESC \`` string terminator, see
+            # :meth:`_string_escape`.
+            "\\": (terminate, None)
+        })
+
+        arguments = dict((char, (csi, event))
+                         for char, event in cls.csi.items())
+        # Not sure why, but those seem to be allowed between CSI
+        # sequence arguments.
+        arguments.update((char, (control, cls.basic[char]))
+                         for char in [ctrl.BEL, ctrl.BS, ctrl.HT, ctrl.LF,
+                                      ctrl.VT, ctrl.FF, ctrl.CR]
+                         if char in cls.basic)
+        arguments.update({
+            "?": (private, None),
+            ";": (separator, None),
+            ctrl.SP: (ignore, None),
+            ctrl.CAN: (abort, None),
+            ctrl.SUB: (abort, None)
+        })
+        arguments.update((char, (digit, None)) for char in "0123456789")
+
+        # Control strings: the payload is either collected (OSC) or
+        # skipped (DCS, SOS, PM and APC) until a terminator is seen.
+        strings = {
+            ctrl.BEL: (string_end, None),
+            ctrl.ST: (string_end, None),
+            ctrl.ESC: (string_escape, None),
+            ctrl.CAN: (terminate, None),
+            ctrl.SUB: (terminate, None)
+        }
+
+        transitions = {
+            "stream": (stream, (draw, None)),
+            "escape": (escape, (unhandled, None)),
+            "arguments": (arguments, (csi, None)),
+            "sharp": (dict((char, (emit, event))
+                           for char, event in cls.sharp.items()),
+                      (unhandled, None)),
+            "charset": ({}, (charset, None)),
+            "osc": (strings, (payload, None)),
+            "string": (strings, (ignore, None))
+        }
+
+        # Everything the default state would simply draw is a part of
+        # a text run, see :meth:`feed`.
+        text_run = re.compile("[^%s]+" % "".join(
+            re.escape(char) for char in sorted(stream)))
+        string_run = re.compile("[^%s]+" % "".join(
+            re.escape(char) for char in sorted(strings)))
+
+        cls._compiled = key, transitions, text_run, string_run
+        return transitions, text_run, string_run
+
     def reset(self):
         """Reset state to ``"stream"`` and empty parameter attributes."""
         self.state = "stream"
@@ -127,6 +319,38 @@ class Stream(object):
         self.params = []
         self.current = ""
 
+    def getstate(self):
+        """Returns parser state as a tuple of builtin values, which can
+        be passed to :meth:`setstate` of another stream, possibly in
+        another process, to resume parsing in the middle of a sequence.
+
+        >>> stream = Stream()
+        >>> stream.feed(u"\u001b[?5;1")
+        >>> stream.getstate()
+        (u'arguments', (5,), u'1', {u'private': True})
+        """
+        return self.state, tuple(self.params), self.current, dict(self.flags)
+
+    def setstate(self, state):
+        """Restores parser state, returned by :meth:`getstate`.
+
+        :param tuple state: parser state to restore.
+        """
+        self.state, params, self.current, flags = state
+        self.params, self.flags = list(params), dict(flags)
+
+    def __getstate__(self):
+        # Listeners aren't a part of the stream state and have to be
+        # attached again after unpickling.
+        return {"unknown": self.unknown, "stats": self.counters is not None,
+                "state": self.getstate()}
+
+    def __setstate__(self, state):
+        kwargs = dict(state)
+        state = kwargs.pop("state")
+        self.__init__(**kwargs)
+        self.setstate(state)
+
     def consume(self, char):
         """Consume a single unicode character and advance the state as
         necessary.
@@ -137,18 +361,17 @@ class Stream(object):
             raise TypeError(
                 "%s requires unicode input" % self.__class__.__name__)
 
-        try:
-            self.handlers.get(self.state)(char)
-        except TypeError:
-            pass
-        except KeyError:
-            if __debug__:
-                self.flags["state"] = self.state
-                self.flags["unhandled"] = char
-                self.dispatch("debug", *self.params)
-                self.reset()
-            else:
-                raise
+        if self.counters is not None:
+            self.counters["characters"] += len(char)
+
+        # Be forgiving and accept more than one character at once, the
+        # way the old string-concatenating parser did.
+        for char in char:
+            mapping, default = self.transitions[self.state]
+            action, arg = mapping.get(char, default)
+            action(self, char, arg)
+
+        self.flush()
 
     def feed(self, chars):
         """Consume a unicode string and advance the state as necessary.
@@ -159,7 +382,115 @@ class Stream(object):
             raise TypeError(
                 "%s requires unicode input" % self.__class__.__name__)
 
-        for char in chars: self.consume(char)
+        if self.counters is not None:
+            self.counters["characters"] += len(chars)
+
+        self._feed(chars)
+        self.flush()
+
+    def _feed(self, chars):
+        """Consume a unicode string without flushing batched events."""
+        # Printable characters are dispatched in runs, as a single
+        # ``draw_text`` event, complete CSI sequences and control string
+        # payload are also consumed in one go; everything else, including
+        # sequences split across chunks, goes through the state machine
+        # char by char.
+        transitions = self.transitions
+        arguments = transitions["arguments"][0]
+        csi = type(self)._csi.__func__
+        match, match_string = self.text_run.match, self.string_run.match
+        match_sequence = self.sequence.match
+        draw_text = self._text_handler()
+        idx, length = 0, len(chars)
+        while idx < length:
+            state = self.state
+            if state == "stream":
+                run = match(chars, idx)
+                if run:
+                    draw_text(run.group())
+                    idx = run.end()
+                    continue
+
+                sequence = match_sequence(chars, idx)
+                if sequence:
+                    private, params, final = sequence.groups()
+                    action, event = arguments.get(final, (None, None))
+                    if action is csi and event is not None:
+                        self._sequence(event, params, private, final)
+                        idx = sequence.end()
+                        continue
+            elif state == "osc" or state == "string":
+                run = match_string(chars, idx)
+                if run:
+                    if state == "osc":
+                        self._payload(run.group(), None)
+                    idx = run.end()
+                    continue
+
+            char = chars[idx]
+            mapping, default = transitions[self.state]
+            action, arg = mapping.get(char, default)
+            action(self, char, arg)
+            idx += 1
+
+    def flush(self):
+        """Hand the events, queued since the last call, over to the
+        listeners, which support batch delivery; see :meth:`attach`.
+
+        .. note::
+
+           Both :meth:`feed` and :meth:`consume` flush automatically,
+           so there's no need to call this method explicitly, unless
+           you're dispatching events by hand.
+        """
+        for listener, queue in self.batches:
+            if queue:
+                events = queue[:]
+                del queue[:]
+                listener.dispatch_batch(events)
+
+    def events(self, chars, chunk_size=4096):
+        """Consume a string and lazily yield ``(event, args, flags)``
+        tuples instead of dispatching events to the attached listeners.
+
+        Parser state is shared with :meth:`feed`, so both APIs can be
+        mixed freely, as long as :meth:`feed` isn't called while the
+        generator is suspended. Input is parsed ``chunk_size``
+        characters at a time, thus breaking out of the loop early saves
+        parsing the rest of ``chars``.
+
+        >>> stream = Stream()
+        >>> list(stream.events(u"\u001b[?5h"))
+        [(u'set_mode', (5,), {u'private': True})]
+
+        :param chars: a string to feed from, the type of the string is
+                      the same as for :meth:`feed`.
+        :param int chunk_size: number of characters to parse at once.
+        """
+        queue = []
+        counts = self.counters and self.counters["events"]
+
+        def collect(event, *args, **kwargs):
+            if counts is not None:
+                counts[event] = counts.get(event, 0) + 1
+            # Events, dispatched without a reset, share flags with the
+            # rest of the sequence, hence the copy.
+            queue.append((event, args, dict(self.flags)))
+            if kwargs.get("reset", True): self.reset()
+
+        bound = self.bound
+        self.dispatch = collect
+        try:
+            for offset in xrange(0, len(chars), chunk_size):
+                self.feed(chars[offset:offset + chunk_size])
+
+                for item in queue:
+                    yield item
+                del queue[:]
+        finally:
+            del self.dispatch
+            if bound is not None:
+                self.dispatch = self._dispatch_bound
 
     def attach(self, screen, only=()):
         """Adds a given screen to the listeners queue.
@@ -168,8 +499,20 @@ class Stream(object):
         :param list only: a list of events you want to dispatch to a
                           given screen (empty by default, which means
                           -- dispatch all events).
+
+        If a screen defines a ``dispatch_batch()`` method, it is called
+        once per :meth:`feed` with a list of ``(event, args, flags)``
+        tuples, instead of calling a handler for each event.
         """
+        if self.bound is not None:
+            raise ValueError("a listener is already bound to the stream")
+
         self.listeners.append((screen, set(only)))
+        # Looking the method up on the type, so that catch-all
+        # listeners, defining ``__getattr__()``, don't qualify.
+        if hasattr(type(screen), "dispatch_batch"):
+            self.batches.append((screen, []))
+        self.routes.clear()
 
     def detach(self, screen):
         """Removes a given screen from the listeners queue and failes
@@ -177,9 +520,198 @@ class Stream(object):
 
         :param vt102.screens.Screen screen: a screen to detach.
         """
-        for idx, (listener, _) in enumerate(self.listeners):
-            if screen is listener:
-                self.listeners.pop(idx)
+        if self.bound is screen:
+            self.bound = None
+            del self.dispatch
+
+        self.listeners[:] = [(listener, only)
+                             for listener, only in self.listeners
+                             if listener is not screen]
+        self.batches[:] = [(listener, queue)
+                           for listener, queue in self.batches
+                           if listener is not screen]
+        self.routes.clear()
+
+    def bind(self, screen):
+        """Attaches a given screen as the only listener, so that events
+        are dispatched straight to its methods, bypassing the listener
+        loop, ``only`` filtering and batch delivery; text runs are
+        passed to ``draw_text()`` without going through
+        :meth:`dispatch` at all.
+
+        >>> import vt102
+        >>> screen = vt102.Screen(80, 24)
+        >>> stream = Stream()
+        >>> stream.bind(screen)
+        >>> stream.feed(u"foo")
+        >>> screen.display[0].rstrip()
+        u'foo'
+
+        :param vt102.screens.Screen screen: a screen to bind to.
+        """
+        if self.listeners:
+            raise ValueError("can't bind to a stream with listeners")
+
+        self.listeners.append((screen, set()))
+        self.routes.clear()
+        self.bound = screen
+        self.dispatch = self._dispatch_bound
+
+    def _dispatch_bound(self, event, *args, **kwargs):
+        """Dispatch an event to the listener, bound with :meth:`bind`;
+        see :meth:`dispatch`.
+        """
+        try:
+            handler = self.routes[event]
+        except KeyError:
+            handler = self.routes[event] = self._bound_handler(event)
+
+        flags = self.flags
+        try:
+            if flags:
+                handler(*args, **flags)
+            else:
+                handler(*args)
+        except TypeError:
+            if not self._rejected(event, args):
+                raise
+            return
+
+        if kwargs.get("reset", True): self.reset()
+
+    def _bound_handler(self, event):
+        """Returns the bound listener's method, handling a given event."""
+        handler = getattr(self.bound, event, None)
+        if handler is None and event == "draw_text":
+            draw = getattr(self.bound, "draw", None)
+            if draw is not None:
+                handler = self._draw_each(draw)
+
+        if handler is None:
+            handler = self._discard
+
+        if self.counters is not None:
+            count, inner = self._count(event, self.counters["events"]), \
+                handler
+
+            def handler(*args, **flags):
+                count()
+                inner(*args, **flags)
+
+        return handler
+
+    def _text_handler(self):
+        """Returns a callable, which handles a run of printable
+        characters in the default state, where there are no flags to
+        pass and nothing to reset.
+        """
+        if self.bound is not None and self.dispatch == self._dispatch_bound:
+            handler = self.routes.get("draw_text")
+            if handler is None:
+                handler = self.routes["draw_text"] = \
+                    self._bound_handler("draw_text")
+            return handler
+        else:
+            return functools.partial(self.dispatch, "draw_text")
+
+    @staticmethod
+    def _discard(*args, **flags):
+        """Handles events the bound listener doesn't care about."""
+
+    def route(self, event):
+        """Returns a tuple of listeners' bound methods, handling a given
+        event; the result is cached in :attr:`routes` until the next
+        :meth:`attach` or :meth:`detach` call.
+
+        .. note::
+
+           Since handlers are looked up once per event, listeners
+           shouldn't grow new handlers after being attached, and
+           :attr:`listeners` shouldn't be modified directly.
+
+        :param unicode event: event to look up handlers for.
+        """
+        queues = dict((id(listener), queue)
+                      for listener, queue in self.batches)
+
+        handlers = []
+        if self.counters is not None:
+            handlers.append(self._count(event, self.counters["events"]))
+
+        for listener, only in self.listeners:
+            if only and event not in only and not (
+                    event == "draw_text" and "draw" in only):
+                continue
+
+            if id(listener) in queues:
+                handlers.append(self._enqueue(event, queues[id(listener)]))
+                continue
+
+            handler = getattr(listener, event, None)
+            if handler is None and event == "draw_text":
+                draw = getattr(listener, "draw", None)
+                if draw is not None:
+                    handler = self._draw_each(draw)
+
+            if handler is not None:
+                handlers.append(handler)
+
+        # Events nobody listens to end up with an empty tuple, so we
+        # don't have to look them up over and over again.
+        self.routes[event] = handlers = tuple(handlers)
+        return handlers
+
+    def statistics(self):
+        """Returns a snapshot of the counters, gathered since the
+        stream was created with ``stats=True``:
+
+        * ``"characters"`` and ``"bytes"`` -- the amount of input
+          consumed, bytes are only counted by :class:`ByteStream`;
+        * ``"events"`` -- a mapping of event names to the number of
+          times each event was dispatched;
+        * ``"csi"`` -- a mapping of CSI final characters to the number
+          of sequences seen, including the unknown ones;
+        * ``"params"`` -- the longest CSI parameter list seen;
+        * ``"unknown"`` -- a copy of :attr:`unknown_sequences`.
+
+        >>> stream = Stream(stats=True)
+        >>> stream.feed(u"\u001b[1;31mfoo")
+        >>> stream.statistics()["csi"]
+        {u'm': 1}
+        """
+        stats = dict(self.counters or {})
+        for name in ["events", "csi"]:
+            stats[name] = dict(stats.get(name, {}))
+        stats["unknown"] = dict(self.unknown_sequences)
+        return stats
+
+    @staticmethod
+    def _count(event, counts):
+        """Returns a handler, which counts dispatched events."""
+        def count(*args, **flags):
+            counts[event] = counts.get(event, 0) + 1
+        return count
+
+    def _count_sequence(self, final, params):
+        """Counts a CSI sequence with a given final character."""
+        counters = self.counters
+        counters["csi"][final] = counters["csi"].get(final, 0) + 1
+        counters["params"] = max(counters["params"], params)
+
+    @staticmethod
+    def _enqueue(event, queue):
+        """Returns a handler, which queues an event for batch delivery."""
+        def enqueue(*args, **flags):
+            queue.append((event, args, flags))
+        return enqueue
+
+    @staticmethod
+    def _draw_each(draw):
+        """Adapts a ``draw()`` handler to ``draw_text`` events."""
+        def draw_text(text, **flags):
+            for char in text:
+                draw(char, **flags)
+        return draw_text
 
     def dispatch(self, event, *args, **kwargs):
         """Dispatch an event.
@@ -189,6 +721,10 @@ class Stream(object):
         events it should define a ``draw()`` method or pass
         ``only=["draw"]`` argument to :meth:`attach`.
 
+        Runs of printable characters are dispatched as ``draw_text``
+        events; listeners without a ``draw_text()`` method get a
+        ``draw()`` call for each character of the run instead.
+
         .. warning::
 
            If any of the attached listeners throws an exception, the
@@ -197,64 +733,88 @@ class Stream(object):
         :param unicode event: event to dispatch.
         :param list args: arguments to pass to event handlers.
         """
-        for listener, only in self.listeners:
-            if only and event not in only:
-                continue
+        handlers = self.routes.get(event)
+        if handlers is None:
+            handlers = self.route(event)
 
-            try:
-                getattr(listener, event)(*args, **self.flags)
-            except AttributeError:
-                pass
-        else:
-            if kwargs.get("reset", True): self.reset()
+        flags = self.flags
+        try:
+            for handler in handlers:
+                handler(*args, **flags)
+        except TypeError:
+            if not self._rejected(event, args):
+                raise
+            return
+
+        if kwargs.get("reset", True): self.reset()
 
-    # State transformers.
+    # Transition actions.
     # ...................
 
-    def _stream(self, char):
-        """Process a character when in the default ``"stream"`` state."""
-        if char in self.basic:
-            self.dispatch(self.basic[char])
-        elif char == ctrl.ESC:
-            self.state = "escape"
-        elif char == ctrl.CSI:
-            self.state = "arguments"
-        elif char not in [ctrl.NUL, ctrl.DEL]:
-            self.dispatch("draw", char)
-
-    def _escape(self, char):
-        """Handle characters seen when in an escape sequence.
-
-        Most non-VT52 commands start with a left-bracket after the
-        escape and then a stream of parameters and a command; with
-        a single notable exception -- :data:`escape.DECOM` sequence,
-        which starts with a sharp.
-        """
-        if char == "#":
-            self.state = "sharp"
-        elif char == "[":
-            self.state = "arguments"
-        elif char in "()":
-            self.state = "charset"
-            self.flags["mode"] = char
-        else:
-            self.dispatch(self.escape[char])
+    def _draw(self, char, _):
+        """Display a character, which has no special meaning."""
+        self.dispatch("draw", char)
+
+    def _ignore(self, char, _):
+        """Skip a character, which has no meaning in the current
+        state.
+        """
+
+    def _enter(self, char, state):
+        """Switch to a given ``state``."""
+        self.state = state
 
-    def _sharp(self, char):
-        """Parse arguments of a `"#"` seqence."""
-        self.dispatch(self.sharp[char])
+    def _emit(self, char, event):
+        """Dispatch an argumentless ``event`` and reset the state."""
+        self.dispatch(event)
 
-    def _charset(self, char):
+    def _control(self, char, event):
+        """Dispatch an ``event`` for a control character, seen in the
+        middle of a CSI sequence, leaving the state untouched.
+        """
+        # Flags, collected so far, belong to the sequence, not to the
+        # control character.
+        flags, self.flags = self.flags, {}
+        try:
+            self.dispatch(event, reset=False)
+        finally:
+            if self.state != "stream":
+                self.flags = flags
+
+    def _charset_mode(self, char, _):
+        """Start a ``G0`` or ``G1`` charset selection."""
+        self.state = "charset"
+        self.flags["mode"] = char
+
+    def _charset(self, char, _):
         """Parse ``G0`` or ``G1`` charset code."""
         self.dispatch("set-charset", char)
 
-    def _arguments(self, char):
-        """Parse arguments of an escape sequence.
+    def _private(self, char, _):
+        """Mark the current CSI sequence as private."""
+        self.flags["private"] = True
+
+    def _digit(self, char, _):
+        """Accumulate a digit of the current CSI parameter."""
+        # Anything longer than five significant digits is capped at
+        # 9999 anyway, so there's no need to keep the rest.
+        self.current = (self.current + char).lstrip("0")[:5]
+
+    def _separator(self, char, _):
+        """Finish the current CSI parameter and start the next one."""
+        if len(self.params) < self.params_limit:
+            self.params.append(min(int(self.current or 0), 9999))
+        self.current = ""
+
+    def _csi(self, char, event):
+        """Finish a CSI sequence and dispatch the corresponding
+        ``event``, if any.
 
         All parameters are unsigned, positive decimal integers, with
         the most significant digit sent first. Any parameter greater
         than 9999 is set to 9999. If you do not specify a value, a 0
-        value is assumed.
+        value is assumed. Parameters past :attr:`params_limit` are
+        ignored.
 
         .. seealso::
 
@@ -264,31 +824,122 @@ class Stream(object):
            `VT220 Programmer Reference <http://http://vt100.net/docs/vt220-rm/>`_
                For details on the characters valid for use as arguments.
         """
-        if char == "?":
+        if len(self.params) < self.params_limit:
+            self.params.append(min(int(self.current or 0), 9999))
+        if self.counters is not None:
+            self._count_sequence(char, len(self.params))
+
+        if event is None:
+            self._unhandled(char, event)
+        else:
+            self.dispatch(event, *self.params)
+
+    def _sequence(self, event, params, private, final):
+        """Dispatch a complete CSI sequence, parsed in one go, bypassing
+        the state machine.
+
+        :param str event: event to dispatch.
+        :param params: semicolon separated parameters, either unicode or
+                       bytes.
+        :param bool private: ``True`` if the sequence is private.
+        :param unicode final: final character of the sequence.
+        """
+        if private:
             self.flags["private"] = True
-        elif char in [ctrl.BEL, ctrl.BS, ctrl.HT, ctrl.LF, ctrl.VT,
-                      ctrl.FF, ctrl.CR]:
-            # Not sure why, but those seem to be allowed between CSI
-            # sequence arguments.
-            self.dispatch(self.basic[char], reset=False)
-        elif char == ctrl.SP:
-            pass
-        elif char in [ctrl.CAN, ctrl.SUB]:
-            # If CAN or SUB is received during a sequence, the current
-            # sequence is aborted; terminal displays the substitute
-            # character, followed by characters in the sequence received
-            # after CAN or SUB.
-            self.dispatch("draw", char)
-            self.state = "stream"
-        elif char.isdigit():
-            self.current += char
+        separator = b";" if isinstance(params, bytes) else ";"
+        params = [min(int(param or 0), 9999)
+                  for param in params.split(separator)[:self.params_limit]]
+        if self.counters is not None:
+            self._count_sequence(final, len(params))
+        self.dispatch(event, *params)
+
+    def _abort(self, char, _):
+        """Abort the current CSI sequence.
+
+        If CAN or SUB is received during a sequence, the current
+        sequence is aborted; terminal displays the substitute
+        character, followed by characters in the sequence received
+        after CAN or SUB.
+        """
+        self.dispatch("draw", char)
+        self.state = "stream"
+
+    def _terminate(self, char, _):
+        """Silently abort the current sequence."""
+        self.reset()
+
+    def _payload(self, chars, _):
+        """Collect ``OSC`` string payload, up to :attr:`osc_limit`
+        characters.
+        """
+        if len(self.current) < self.osc_limit:
+            self.current += chars[:self.osc_limit - len(self.current)]
+
+    def _string_end(self, char, _):
+        """Finish a control string, dispatching an ``osc`` event with
+        the collected payload for ``OSC`` strings.
+        """
+        if self.state == "osc":
+            self.dispatch("osc", self.current)
         else:
-            self.params.append(min(int(self.current or 0), 9999))
+            self.reset()
 
-            if char == ";":
-                self.current = ""
-            else:
-                self.dispatch(self.csi[char], *self.params)
+    def _string_escape(self, char, _):
+        """Finish a control string on ``ESC``, which is either the first
+        half of ``ESC \\`` string terminator or the start of a new
+        escape sequence.
+        """
+        self._string_end(char, _)
+        self.state = "escape"
+
+    def _rejected(self, event, args):
+        """Handle an event, a listener rejected the arguments of, with
+        :exc:`TypeError`, according to the :attr:`unknown` policy; the
+        state is reset either way, so that the flags of the rejected
+        sequence don't leak into the following events.
+
+        :returns: ``False`` if the error should be re-raised.
+        """
+        if self.unknown == "raise" or event == "debug":
+            self.reset()
+            return False
+
+        # Parser state depends on how the sequence was split between
+        # chunks, so a fixed one is used instead.
+        self._report("rejected", event, args)
+        return True
+
+    def _unhandled(self, char, _):
+        """Handle a character, which can't be handled in the current
+        state, according to the :attr:`unknown` policy.
+        """
+        self._report(self.state, char, self.params)
+
+    def _report(self, state, char, params):
+        """Count a ``(state, char)`` pair in :attr:`unknown_sequences`
+        and act according to the :attr:`unknown` policy, then reset the
+        parser state.
+        """
+        unknown = self.unknown
+        if unknown == "ignore" and self.counters is None:
+            return self.reset()
+
+        key = state, char
+        count = self.unknown_sequences[key] = \
+            self.unknown_sequences.get(key, 0) + 1
+
+        if unknown == "debug" or (unknown == "sample" and
+                                  (count - 1) % self.sample_rate == 0):
+            self.flags["state"] = state
+            self.flags["unhandled"] = char
+            self.dispatch("debug", *params)
+        elif unknown == "raise":
+            # Otherwise the stream would be stuck in the middle of the
+            # sequence.
+            self.reset()
+            raise KeyError(char)
+
+        self.reset()
 
 
 class ByteStream(Stream):
@@ -305,6 +956,14 @@ class ByteStream(Stream):
     * Use ``"utf-8"`` with invalid bytes replaced -- this one will
       allways succeed.
 
+    Only the offending bytes are passed to fallback decoders, the rest
+    of the input is decoded with the preferred one. If a single chunk
+    has more than :attr:`fallback_limit` offending byte ranges, the
+    decoder that handled the last one becomes *sticky* and is tried
+    first for the rest of the chunk; the next :meth:`feed` starts with
+    the first decoder again. :attr:`fallbacks` counts byte ranges,
+    handled by each of the fallback encodings.
+
     >>> stream = ByteStream()
     >>> stream.feed(b"foo".decode("utf-8"))
     Traceback (most recent call last):
@@ -319,38 +978,321 @@ class ByteStream(Stream):
                            ex: ``"utf-8"`` and second defines how
                            decoding errors should be handeld; see
                            :meth:`str.decode` for possible values.
-    """
 
-    def __init__(self, encodings=None):
-        encodings = encodings or [
+    :param bool native: when ``True``, the input is scanned for control
+                        bytes and only the text between them is decoded;
+                        complete CSI sequences are parsed right from
+                        bytes. This requires an ASCII compatible
+                        encoding, which all of the default ones are.
+
+    Other keyword arguments are passed to :class:`Stream`.
+    """
+    __slots__ = ["encodings", "buffer", "decoders", "sticky", "native",
+                 "read_buffer", "fallbacks"]
+
+    #: A token of the input in native mode: either a complete CSI
+    #: sequence without intermediate control characters, a control byte
+    #: or a run of text. Control bytes are never a part of a multibyte
+    #: character in an ASCII compatible encoding.
+    token = re.compile(b"""
+        (\x1b\\[(\\??)([0-9;]{0,64})([\x40-\x7e]))
+      | ([\x00-\x1f\x7f])
+      | [^\x00-\x1f\x7f]+
+    """, re.VERBOSE)
+
+    #: A byte, which is not a valid ASCII character.
+    non_ascii = re.compile(b"[\x80-\xff]")
+
+    #: A mapping of control bytes to the corresponding characters.
+    control_chars = dict((chr(code), unichr(code))
+                         for code in range(0x20) + [0x7f])
+
+    #: Number of fallbacks in a single chunk, after which the preferred
+    #: decoder is switched until the end of the chunk.
+    fallback_limit = 8
+
+    def __init__(self, encodings=None, native=False, **kwargs):
+        self.encodings = [tuple(pair) for pair in encodings or [
             ("utf-8", "strict"),
             ("cp437", "strict"),
             ("utf-8", "replace")
-        ]
+        ]]
 
         self.buffer = b"", 0
-        self.decoders = [codecs.getincrementaldecoder(encoding)(errors)
-                         for encoding, errors in encodings]
 
-        super(ByteStream, self).__init__()
+        #: Incremental decoders for :attr:`encodings`, created on first
+        #: use; see :meth:`_decoder`.
+        self.decoders = [None] * len(self.encodings)
 
-    def feed(self, chars):
+        #: Index of the preferred decoder in :attr:`decoders`.
+        self.sticky = 0
+
+        self.native = native
+        self.read_buffer = None
+
+        #: A mapping of ``(encoding, errors)`` pairs to the number of
+        #: byte ranges decoded with a fallback decoder.
+        self.fallbacks = dict.fromkeys(self.encodings, 0)
+
+        super(ByteStream, self).__init__(**kwargs)
+
+    def decode(self, chars, final=False):
+        """Decodes a chunk of bytes, falling back to other decoders for
+        the offending byte ranges only.
+
+        :param bytes chars: a string to decode.
+        :param bool final: when ``True`` incomplete characters at the
+                           end of ``chars`` aren't buffered.
+        """
+        decoder = self._decoder(self.sticky)
+        pending, flag = self.buffer
+        # Buffered decoders concatenate pending bytes with the input,
+        # which only works for buffers if the former is a bytearray.
         if not isinstance(chars, bytes):
-            raise TypeError(
-                "%s requires input in bytes" % self.__class__.__name__)
+            pending = bytearray(pending)
+        decoder.setstate((pending, flag))
 
-        for decoder in self.decoders:
-            decoder.setstate(self.buffer)
+        try:
+            decoded = decoder.decode(chars, final)
+        except UnicodeDecodeError as e:
+            error = e
+        else:
+            self.buffer = self._getstate(decoder)
+            return decoded
+
+        decoded, fallbacks = [], 0
+        while error is not None:
+            # The exception holds the decoder buffer *and* the input,
+            # decoder state is left unchanged.
+            data, start, end = error.object, error.start, error.end
+            decoder.setstate((b"", 0))
+            decoded.append(decoder.decode(data[:start]))
+            idx, chunk = self._fallback(data[start:end], error)
+            decoded.append(chunk)
+
+            fallbacks += 1
+            if fallbacks > self.fallback_limit and idx != self.sticky:
+                self.sticky, decoder = idx, self._decoder(idx)
+                decoder.setstate((b"", 0))
 
             try:
-                chars = decoder.decode(chars)
+                decoded.append(decoder.decode(data[end:], final))
+            except UnicodeDecodeError as e:
+                error = e
+            else:
+                error = None
+
+        self.buffer = self._getstate(decoder)
+        return "".join(decoded)
+
+    def getstate(self):
+        """Returns parser state along with bytes of an incomplete
+        character, buffered by the decoder; see :meth:`Stream.getstate`.
+        """
+        return super(ByteStream, self).getstate() + (self.buffer,
+                                                     self.sticky)
+
+    def setstate(self, state):
+        """Restores parser and decoder state, returned by
+        :meth:`getstate`.
+
+        :param tuple state: parser state to restore.
+        """
+        super(ByteStream, self).setstate(state[:-2])
+        (pending, flag), self.sticky = state[-2:]
+        self.buffer = bytes(pending), flag
+
+    def statistics(self):
+        """Returns a snapshot of the counters, see
+        :meth:`Stream.statistics`; ``"fallbacks"`` is a copy of
+        :attr:`fallbacks`.
+        """
+        stats = super(ByteStream, self).statistics()
+        stats["fallbacks"] = dict(self.fallbacks)
+        return stats
+
+    def __getstate__(self):
+        state = super(ByteStream, self).__getstate__()
+        state.update(encodings=self.encodings, native=self.native)
+        return state
+
+    def _decoder(self, idx):
+        """Returns an incremental decoder for a given index in
+        :attr:`encodings`, creating it if necessary.
+        """
+        decoder = self.decoders[idx]
+        if decoder is None:
+            encoding, errors = self.encodings[idx]
+            decoder = self.decoders[idx] = \
+                codecs.getincrementaldecoder(encoding)(errors)
+        return decoder
+
+    @staticmethod
+    def _getstate(decoder):
+        pending, flag = decoder.getstate()
+        return bytes(pending), flag
+
+    def _fallback(self, chars, error):
+        """Decodes a range of bytes, the preferred decoder failed on,
+        with the first fallback decoder that succeeds.
+        """
+        for idx in xrange(len(self.encodings)):
+            if idx == self.sticky:
+                continue
+
+            decoder = self._decoder(idx)
+            decoder.setstate((b"", 0))
+            try:
+                decoded = decoder.decode(chars, final=True)
             except UnicodeDecodeError:
                 continue
 
-            self.buffer = decoder.getstate()
-            return super(ByteStream, self).feed(chars)
+            self.fallbacks[self.encodings[idx]] += 1
+            return idx, decoded
         else:
-            raise
+            raise error
+
+    def feed(self, chars):
+        """Decode and consume a chunk of bytes.
+
+        :param chars: a string to feed from; any of :data:`binary_types`
+                      will do, so there's no need to copy a buffer into
+                      a new :func:`bytes` object.
+        """
+        if not isinstance(chars, binary_types):
+            raise TypeError(
+                "%s requires input in bytes" % self.__class__.__name__)
+
+        # A burst of binary data shouldn't switch the encoding for good:
+        # a strict fallback, like ``"cp437"``, never fails, so the first
+        # decoder wouldn't get a chance otherwise.
+        self.sticky = 0
+
+        counters = self.counters
+        if self.native:
+            if counters is not None:
+                # Characters are adjusted for non-ASCII text, see
+                # :meth:`_feed_native`.
+                counters["bytes"] += len(chars)
+                counters["characters"] += len(chars)
+            self._feed_native(chars)
+        else:
+            chars, size = self.decode(chars), len(chars)
+            if counters is not None:
+                counters["bytes"] += size
+                counters["characters"] += len(chars)
+            self._feed(chars)
+
+        self.flush()
+
+    def feed_from_fd(self, fd, bufsize=65536):
+        """Read at most ``bufsize`` bytes from a file descriptor into a
+        reusable buffer and feed them to the stream.
+
+        :param int fd: a file descriptor to read from, ex: the master
+                       end of a pty.
+        :param int bufsize: maximum number of bytes to read.
+        :returns: the number of bytes read, ``0`` means end of file.
+        """
+        if self.read_buffer is None or len(self.read_buffer) != bufsize:
+            self.read_buffer = bytearray(bufsize)
+
+        with io.FileIO(fd, closefd=False) as f:
+            read = f.readinto(self.read_buffer) or 0
+
+        if read:
+            self.feed(memoryview(self.read_buffer)[:read])
+        return read
+
+    def feed_file(self, path, chunk_size=65536):
+        """Feed the whole file, for instance a recorded typescript, to
+        the stream. The file is memory mapped and fed ``chunk_size``
+        bytes at a time, without copying.
+
+        :param unicode path: path to the file.
+        :param int chunk_size: number of bytes to feed at once.
+        """
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return
+
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, chunk_size):
+                    self.feed(buffer(mapped, offset, chunk_size))
+            finally:
+                mapped.close()
+
+    def _feed_native(self, data):
+        """Consume a chunk of bytes, decoding only the text between
+        control bytes.
+        """
+        # Regular expressions in Python 2 only work on objects with the
+        # old-style buffer interface; the groups of a match on a buffer
+        # object are always byte strings.
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        elif isinstance(data, bytearray):
+            data = buffer(data)
+
+        transitions, controls = self.transitions, self.control_chars
+        match, match_text = self.token.match, self.text_run.match
+        draw_text = self._text_handler()
+        non_ascii = self.non_ascii.search
+        csi = type(self)._csi.__func__
+
+        idx, length = 0, len(data)
+        while idx < length:
+            token = match(data, idx)
+            sequence, private, params, final, control = token.groups()
+            idx = token.end()
+
+            if not sequence and not control:
+                # ASCII text decodes the same in any ASCII compatible
+                # encoding; incomplete characters can't span across a
+                # control byte, so the decoder isn't allowed to buffer
+                # them.
+                text = token.group()
+                if self.buffer[0] or non_ascii(text):
+                    size = len(text)
+                    text = self.decode(text, final=idx < length)
+                    if self.counters is not None:
+                        self.counters["characters"] += len(text) - size
+                else:
+                    text = text.decode("ascii")
+                if self.state == "stream":
+                    run = match_text(text)
+                    if run and run.end() == len(text):
+                        draw_text(text)
+                        continue
+
+                self._feed(text)
+                continue
+
+            if self.buffer[0]:
+                self._feed(self.decode(b"", final=True))
+
+            if sequence and self.state == "stream":
+                final = final.decode("ascii")
+                action, event = transitions["arguments"][0].get(
+                    final, (None, None))
+                if action is csi and event is not None:
+                    self._sequence(event, params, private, final)
+                    continue
+
+            if sequence:
+                # Either unknown or in the middle of another sequence,
+                # let the state machine deal with it.
+                self._feed(sequence.decode("latin-1"))
+            else:
+                char, state = controls[control], self.state
+                mapping, default = transitions[state]
+                if state == "stream" and char not in mapping:
+                    draw_text(char)  # Same as in `_feed`.
+                else:
+                    action, arg = mapping.get(char, default)
+                    action(self, char, arg)
 
 
 class DebugStream(ByteStream):
@@ -368,6 +1310,7 @@ class DebugStream(ByteStream):
     :param list only: a list of events you want to debug (empty by
                       default, which means -- debug all events).
     """
+    __slots__ = ()
 
     def __init__(self, to=sys.stdout, only=(), *args, **kwargs):
         super(DebugStream, self).__init__(*args, **kwargs)
@@ -383,12 +1326,125 @@ class DebugStream(ByteStream):
 
             def __getattr__(self, event):
                 def inner(*args, **flags):
-                    to.write(event.upper() + " ")
-                    to.write("; ".join(map(self.fixup, args)))
-                    to.write(" ")
-                    to.write(", ".join("{0}: {1}".format(name, self.fixup(arg))
-                                       for name, arg in flags.iteritems()))
-                    to.write("\n")
+                    to.write("{0} {1} {2}\n".format(
+                        event.upper(), "; ".join(map(self.fixup, args)),
+                        ", ".join("{0}: {1}".format(name, self.fixup(arg))
+                                  for name, arg in flags.iteritems())))
+
+                # Cache the handler, so it's only created once per event.
+                setattr(self, event, inner)
                 return inner
 
         self.attach(Bugger(), only=only)
+
+
+class Coalescer(object):
+    """A batch listener, which merges adjacent redundant events before
+    passing them on to a given listener; the resulting state of the
+    listener is the same, as if it got all of the events.
+
+    >>> import vt102
+    >>> screen = vt102.Screen(80, 24)
+    >>> stream = Stream()
+    >>> stream.attach(Coalescer(screen))
+
+    The following events are merged:
+
+    * consecutive ``cursor_forward`` and ``cursor_back`` moves;
+    * cursor moves, immediately followed by a ``cursor_position``,
+      which overrides them, unless :data:`~vt102.modes.DECOM` is set
+      on the listener (or might be set by an earlier event);
+    * repeated ``select_graphic_rendition`` events and the ones,
+      immediately followed by a reset of graphic rendition.
+
+    .. note::
+
+       Vertical moves aren't merged, because the cursor is clamped
+       to the scrolling region, which makes two short moves different
+       from a single long one, if the cursor is above or below it.
+
+    :param listener: a listener to pass events on to.
+    """
+
+    #: Events, which only change cursor position.
+    motions = frozenset([
+        "cursor_up", "cursor_down", "cursor_forward", "cursor_back",
+        "cursor_up1", "cursor_down1", "cursor_to_column", "cursor_to_line",
+        "cursor_position", "carriage_return", "backspace", "tab"
+    ])
+
+    #: Events, which might change :data:`~vt102.modes.DECOM`.
+    origin_changes = frozenset(["set_mode", "reset_mode", "restore_cursor",
+                                "reset", "set_margins"])
+
+    def __init__(self, listener):
+        self.listener = listener
+
+    def coalesce(self, events):
+        """Returns a list of events with the redundant ones merged.
+
+        :param list events: a list of ``(event, args, flags)`` tuples.
+        """
+        mode = getattr(self.listener, "mode", None)
+        absolute = mode is not None and mo.DECOM not in mode
+        merged = []
+        for item in events:
+            event, args, flags = item
+            if event in self.origin_changes:
+                absolute = False
+
+            if merged and not flags and not merged[-1][2]:
+                last, last_args, _ = merged[-1]
+                if last == event and event in ["cursor_forward",
+                                               "cursor_back"]:
+                    if len(args) <= 1 and len(last_args) <= 1:
+                        count = ((last_args and last_args[0] or 1) +
+                                 (args and args[0] or 1))
+                        merged[-1] = event, (count, ), flags
+                        continue
+                elif last == event == "select_graphic_rendition":
+                    if args == last_args:
+                        continue
+
+            # Drop preceding events, which are overriden by this one.
+            overriden = ()
+            if event == "cursor_position" and absolute and not flags:
+                overriden = self.motions
+            elif (event == "select_graphic_rendition" and not flags and
+                  (not args or not args[0])):
+                overriden = [event]
+
+            while (merged and merged[-1][0] in overriden and
+                   not merged[-1][2]):
+                merged.pop()
+
+            merged.append(item)
+        return merged
+
+    def dispatch_batch(self, events):
+        """Merges and passes a batch of events on to the listener.
+
+        Listeners without ``dispatch_batch()`` get a handler call per
+        event, same as :class:`~vt102.screens.Screen` does: unknown
+        events and events with arguments, the handler doesn't accept,
+        are ignored; ``draw_text`` falls back to ``draw()``.
+        """
+        events = self.coalesce(events)
+        listener = self.listener
+        if hasattr(type(listener), "dispatch_batch"):
+            return listener.dispatch_batch(events)
+
+        handlers = {}
+        for event, args, flags in events:
+            handler = handlers.get(event)
+            if handler is None:
+                handler = getattr(listener, event, None)
+                if handler is None and event == "draw_text":
+                    draw = getattr(listener, "draw", None)
+                    if draw is not None:
+                        handler = Stream._draw_each(draw)
+                handler = handlers[event] = handler or Stream._discard
+            try:
+                handler(*args, **flags)
+            except TypeError:
+                pass